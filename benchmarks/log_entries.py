@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+
+from benchmarks.servers import FakeJira, FakePagerDuty
+
+
+# The settings required by `jpi.settings`, the real values are not used.
+ENVIRONMENT = {
+    "QUESTIONS_FILE": "etc/questions.json",
+    "JIRA_USER_EMAIL": "benchmark@example.com",
+    "JIRA_API_TOKEN": "benchmark",
+    "INCIDENT_PROJECT_KEY": "INCIDENT",
+    "PERSON_PROJECT_KEY": "PERSON",
+    "TIMELINE_PROJECT_KEY": "TIMELINE",
+    "QUESTION_PROJECT_KEY": "QUESTION",
+    "PAGERDUTY_API_TOKEN": "benchmark",
+    "PAGERDUTY_USER_EMAIL": "benchmark@example.com",
+    "INCIDENTS_TABLE": "benchmark-incidents",
+    "LOG_ENTRIES_TABLE": "benchmark-log-entries",
+    "CONFIG_TABLE": "benchmark-config",
+    "EVENTS_TABLE": "benchmark-events",
+}
+
+# The fake AWS credentials for DynamoDB Local and the in-memory backend.
+AWS_ENVIRONMENT = {
+    "AWS_ACCESS_KEY_ID": "benchmark",
+    "AWS_SECRET_ACCESS_KEY": "benchmark",
+    "AWS_DEFAULT_REGION": "us-east-1",
+}
+
+
+def get_table_definitions(settings):
+    key = {"AttributeType": "S"}
+    throughput = {"ReadCapacityUnits": 1, "WriteCapacityUnits": 1}
+    return [
+        {
+            "TableName": settings.INCIDENTS_TABLE,
+            "AttributeDefinitions": [
+                {"AttributeName": settings.INCIDENT_ID_FIELD_NAME, **key},
+                {"AttributeName": settings.ISSUE_KEY_FIELD_NAME, **key},
+            ],
+            "KeySchema": [{
+                "AttributeName": settings.INCIDENT_ID_FIELD_NAME,
+                "KeyType": "HASH",
+            }],
+            "GlobalSecondaryIndexes": [{
+                "IndexName": settings.INCIDENTS_ISSUE_KEY_INDEX,
+                "KeySchema": [{
+                    "AttributeName": settings.ISSUE_KEY_FIELD_NAME,
+                    "KeyType": "HASH",
+                }],
+                "Projection": {"ProjectionType": "KEYS_ONLY"},
+                "ProvisionedThroughput": throughput,
+            }],
+            "ProvisionedThroughput": throughput,
+        },
+        {
+            "TableName": settings.LOG_ENTRIES_TABLE,
+            "AttributeDefinitions": [
+                {"AttributeName": settings.LOG_ENTRY_ID_FIELD_NAME, **key},
+            ],
+            "KeySchema": [{
+                "AttributeName": settings.LOG_ENTRY_ID_FIELD_NAME,
+                "KeyType": "HASH",
+            }],
+            "ProvisionedThroughput": throughput,
+        },
+        {
+            "TableName": settings.CONFIG_TABLE,
+            "AttributeDefinitions": [
+                {"AttributeName": settings.CONFIG_PARAMETER_FIELD_NAME, **key},
+            ],
+            "KeySchema": [{
+                "AttributeName": settings.CONFIG_PARAMETER_FIELD_NAME,
+                "KeyType": "HASH",
+            }],
+            "ProvisionedThroughput": throughput,
+        },
+    ]
+
+
+def create_tables(db, settings):
+    """
+    Create the benchmark tables unless they exist.
+    """
+    client = db.get_resource().meta.client
+    existing = client.list_tables()["TableNames"]
+    for definition in get_table_definitions(settings):
+        if definition["TableName"] not in existing:
+            client.create_table(**definition)
+            client.get_waiter("table_exists").wait(
+                TableName=definition["TableName"]
+            )
+
+
+@contextlib.contextmanager
+def database_backend(name):
+    """
+    Use DynamoDB Local (`local`, see "Install and run local DynamoDB" in
+    `README.md`) or an in-memory DynamoDB provided by `moto` (`memory`).
+    """
+    for key, value in AWS_ENVIRONMENT.items():
+        os.environ.setdefault(key, value)
+    if name == "local":
+        os.environ["IS_OFFLINE"] = "True"
+        yield
+        return
+    os.environ.pop("IS_OFFLINE", None)
+    try:
+        import moto
+    except ImportError:
+        sys.exit("The in-memory backend requires moto: pipenv install --dev")
+    # moto < 5 (the versions that support Python 3.7) mocks every
+    # service separately.
+    mock_aws = getattr(moto, "mock_aws", None) or moto.mock_dynamodb
+    with mock_aws():
+        yield
+
+
+def count_database_requests(db, stats):
+    """
+    Count the requests sent by the DynamoDB resources of `jpi.db`.
+    """
+    get_resource = db.get_resource
+    clients = set()
+
+    def count(**kwargs):
+        stats["dynamodb"] += 1
+
+    def get_counted_resource():
+        resource = get_resource()
+        client = resource.meta.client
+        if id(client) not in clients:
+            clients.add(id(client))
+            client.meta.events.register("before-call.dynamodb", count)
+        return resource
+
+    db.get_resource = get_counted_resource
+
+
+def percentile(values, p):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[int(round(p / 100 * (len(values) - 1)))]
+
+
+def run(args):
+    for key, value in ENVIRONMENT.items():
+        os.environ.setdefault(key, value)
+    os.environ["LOG_ENTRIES_PAGE_SIZE"] = str(args.page_size)
+    os.environ["LOG_ENTRIES_WORKERS"] = str(args.workers)
+
+    run_id = uuid.uuid4().hex[:8]
+    pagerduty_server = FakePagerDuty(args.entries, args.incidents, run_id)
+    jira_server = FakeJira(args.jira_latency, args.jira_rate_limited)
+    os.environ["JIRA_SERVER_URL"] = jira_server.url
+    pagerduty_server.start()
+    jira_server.start()
+
+    with database_backend(args.database):
+        from jpi import db, settings, utils
+        from jpi.handlers import log_entries, log_entries_async
+
+        create_tables(db, settings)
+        incidents = db.get_resource().Table(settings.INCIDENTS_TABLE)
+        with incidents.batch_writer() as batch:
+            for i, incident_id in enumerate(pagerduty_server.incident_ids):
+                batch.put_item(Item={
+                    settings.INCIDENT_ID_FIELD_NAME: incident_id,
+                    settings.ISSUE_KEY_FIELD_NAME: f"INCIDENT-{run_id}-{i}",
+                })
+        utils.delete_polling_cursor()
+        utils.update_polling_timestamp(db.get_now())
+        utils.get_pagerduty().url = pagerduty_server.url
+        handler = log_entries_async if args.handler == "async" else log_entries
+
+        stats = {"dynamodb": 0}
+        count_database_requests(db, stats)
+        pagerduty_server.requests = jira_server.requests = 0
+        started = time.monotonic()
+        result = handler({}, None)
+        elapsed = time.monotonic() - started
+
+    pagerduty_server.stop()
+    jira_server.stop()
+
+    latencies = [
+        jira_server.created_at[summary] - served_at
+        for summary, served_at in pagerduty_server.served_at.items()
+        if summary in jira_server.created_at
+    ]
+    round_trips = {
+        "pagerduty": pagerduty_server.requests,
+        "jira": jira_server.requests,
+        "dynamodb": stats["dynamodb"],
+    }
+    return {
+        "ok": result.get("ok"),
+        "entries": args.entries,
+        "incidents": args.incidents,
+        "mirrored": len(latencies),
+        "seconds": round(elapsed, 3),
+        "entries_per_second": round(args.entries / elapsed, 1),
+        "round_trips": round_trips,
+        "round_trips_per_entry": round(
+            sum(round_trips.values()) / max(args.entries, 1), 3
+        ),
+        "rate_limited": jira_server.rate_limited_requests,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+def report(results, baseline=None):
+    for key, value in results.items():
+        line = f"{key:>24}: {value}"
+        if baseline and isinstance(value, (int, float)) and baseline.get(key):
+            change = (value - baseline[key]) / baseline[key] * 100
+            line += f" ({change:+.1f}% vs baseline)"
+        print(line)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description=(
+            "Benchmark of the log entries polling against local fake "
+            "PagerDuty and Jira servers."
+        )
+    )
+    parser.add_argument("--entries", type=int, default=1000)
+    parser.add_argument("--incidents", type=int, default=50)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument(
+        "--handler", choices=["sync", "async"], default="sync"
+    )
+    parser.add_argument(
+        "--jira-latency",
+        type=float,
+        default=0.02,
+        help="Latency of every Jira request in seconds",
+    )
+    parser.add_argument(
+        "--jira-rate-limited",
+        type=float,
+        default=0,
+        help="Share of Jira requests answered with 429, e.g. 0.05",
+    )
+    parser.add_argument(
+        "--database", choices=["memory", "local"], default="memory"
+    )
+    parser.add_argument(
+        "--output", help="Save the results to a JSON file, e.g. a baseline"
+    )
+    parser.add_argument(
+        "--baseline", help="Compare the results to a saved JSON file"
+    )
+
+    args = parser.parse_args()
+
+    logging.basicConfig(stream=sys.stderr, level=logging.WARNING)
+    # The handlers log every log entry.
+    logging.disable(logging.INFO)
+    results = run(args)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    report(results, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,195 @@
+import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import re
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+
+# The issue types and the types of link created by the Jira
+# configuration tool.
+ISSUE_TYPES = ("Incident", "Person", "Question", "Timeline")
+ISSUE_LINK_TYPES = ("Question", "Incident Manager", "Timeline", "Stakeholder")
+
+
+class FakeServer:
+    """
+    A local HTTP server that runs in a background thread. The requests
+    are passed to `handle(method, path, query, body)` which returns a
+    tuple with the status code, the body and the headers of the
+    response. The subclasses override it, the paths they don't serve
+    are responded with 404.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # The headers and the body are written separately.
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def respond(self, method):
+                url = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                with server.lock:
+                    server.requests += 1
+                status, data, headers = server.handle(
+                    method, url.path, parse_qs(url.query), body
+                )
+                data = b"" if data is None else json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self.respond("GET")
+
+            def do_POST(self):
+                self.respond("POST")
+
+            def do_PUT(self):
+                self.respond("PUT")
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = "http://127.0.0.1:{}".format(self.httpd.server_port)
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def handle(self, method, path, query, body):
+        return 404, {}, None
+
+
+class FakePagerDuty(FakeServer):
+    """
+    A fake PagerDuty API that serves `entries` synthetic log entries of
+    `incidents` incidents by means of `/log_entries` endpoint (offset
+    pagination). The time every log entry is served at is recorded.
+    """
+
+    def __init__(self, entries, incidents, run_id):
+        super().__init__()
+        now = datetime.datetime.utcnow()
+        self.incident_ids = [
+            "{}-INCIDENT-{}".format(run_id, i) for i in range(incidents)
+        ]
+        self.log_entries = []
+        for i in range(entries):
+            created_at = now - datetime.timedelta(seconds=entries - i)
+            self.log_entries.append({
+                "id": "{}-ENTRY-{}".format(run_id, i),
+                "type": "annotate_log_entry",
+                "summary": "Benchmark log entry {} of {}".format(i, run_id),
+                "created_at": created_at.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "incident": {
+                    "id": self.incident_ids[i % incidents],
+                    "summary": "Benchmark incident",
+                },
+                "agent": {"summary": "Benchmark Agent"},
+                "channel": {},
+            })
+        self.served_at = {}
+
+    def handle(self, method, path, query, body):
+        if method == "GET" and path == "/log_entries":
+            offset = int(query.get("offset", ["0"])[0])
+            limit = int(query.get("limit", ["25"])[0])
+            page = self.log_entries[offset:offset + limit]
+            now = time.monotonic()
+            with self.lock:
+                for log_entry in page:
+                    self.served_at.setdefault(log_entry["summary"], now)
+            return 200, {
+                "log_entries": page,
+                "offset": offset,
+                "limit": limit,
+                "more": offset + limit < len(self.log_entries),
+                "total": None,
+            }, None
+        if method == "PUT" and path == "/incidents":
+            return 200, {"incidents": body.get("incidents", [])}, None
+        return super().handle(method, path, query, body)
+
+
+class FakeJira(FakeServer):
+    """
+    A fake Jira REST API. Every request takes `latency` seconds and a
+    `rate_limited` share of the requests is answered with `429`. The
+    time every issue is created at is recorded by its summary.
+    """
+
+    def __init__(self, latency=0, rate_limited=0):
+        super().__init__()
+        self.latency = latency
+        self.rate_limited = rate_limited
+        self.rate_limited_requests = 0
+        self.counter = 0
+        self.created_at = {}
+
+    def create_issue(self, fields):
+        with self.lock:
+            self.counter += 1
+            key = "{}-{}".format(fields["project"]["key"], self.counter)
+            self.created_at[fields["summary"]] = time.monotonic()
+            return {"id": str(self.counter), "key": key}
+
+    def handle(self, method, path, query, body):
+        if self.rate_limited and random.random() < self.rate_limited:
+            with self.lock:
+                self.rate_limited_requests += 1
+            return 429, {}, {"Retry-After": "0"}
+        time.sleep(self.latency)
+        path = path.replace("/rest/api/3", "")
+        if method == "POST" and path == "/issue":
+            return 201, self.create_issue(body["fields"]), None
+        if method == "POST" and path == "/issue/bulk":
+            return 201, {
+                "issues": [
+                    self.create_issue(update["fields"])
+                    for update in body["issueUpdates"]
+                ],
+                "errors": [],
+            }, None
+        if method == "POST" and path == "/issueLink":
+            return 201, None, None
+        if path == "/search/jql":
+            return 200, {"issues": [], "isLast": True}, None
+        if path == "/search":
+            return 200, {
+                "startAt": 0, "maxResults": 0, "total": 0, "issues": []
+            }, None
+        if path == "/field":
+            return 200, [], None
+        if path == "/issuetype":
+            return 200, [{"name": name} for name in ISSUE_TYPES], None
+        if path == "/issueLinkType":
+            link_types = [{"name": name} for name in ISSUE_LINK_TYPES]
+            return 200, {"issueLinkTypes": link_types}, None
+        if re.match(r"^/issue/[^/]+/transitions$", path):
+            if method == "GET":
+                transitions = [{"id": "1", "name": "Done"}]
+                return 200, {"transitions": transitions}, None
+            return 204, None, None
+        match = re.match(r"^/issue/([^/]+)$", path)
+        if method == "GET" and match:
+            return 200, {"key": match.group(1), "fields": {}}, None
+        return super().handle(method, path, query, body)
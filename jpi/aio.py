@@ -0,0 +1,16 @@
+import asyncio
+import contextvars
+import functools
+
+
+async def run(func, *args, executor=None, **kwargs):
+    """
+    Run a blocking function in `executor` (or in the default executor
+    of the event loop) without blocking the loop and return its result.
+    The function is run in a copy of the context of the current task.
+    """
+    loop = asyncio.get_event_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        executor, functools.partial(context.run, func, *args, **kwargs)
+    )
@@ -1,39 +1,207 @@
-import json
+import collections
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+import itertools
+import logging
+import random
+import threading
+import time
+import urllib.parse
+
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
-import urllib.parse
 
-from jpi import settings
+from jpi import metrics, settings
+from jpi.api.throttling import TokenBucket
+
+
+client = None
+client_lock = threading.Lock()
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+RETRY_STATUSES = (429, 502, 503, 504)
+
+
+class JiraClient:
+    """
+    An HTTP client of Jira REST API. The client shares a pool of
+    connections between the threads, doesn't exceed the given rate of
+    requests and retries the failed requests:
+
+    - idempotent requests are retried on 429, 502, 503 and 504 statuses
+      and on connection errors;
+    - the other requests are retried on 429 status only (Jira rejects
+      such a request without processing it).
+
+    `Retry-After` header is honored, otherwise a jittered exponential
+    backoff is used. A request isn't retried if Jira asks to wait longer
+    than `JIRA_MAX_BACKOFF` seconds, so a single rate limited request
+    doesn't outlast the invocation.
+    """
+
+    def __init__(
+        self,
+        api_url,
+        user_email,
+        api_token,
+        pool_size=10,
+        rate=10,
+        burst=10,
+        max_retries=3,
+        timeout=10,
+    ):
+        self.api_url = api_url
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate, burst)
+        self.session = requests.Session()
+        self.session.auth = HTTPBasicAuth(user_email, api_token)
+        self.session.headers = {
+            "Accept": "application/json", "Content-Type": "application/json"
+        }
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get_backoff(self, attempt):
+        backoff = min(2 ** attempt, settings.JIRA_MAX_BACKOFF)
+        return backoff / 2 + random.uniform(0, backoff / 2)
+
+    def get_retry_delay(self, response, attempt):
+        """
+        Return the number of seconds to wait before the next attempt or
+        `None` if `Retry-After` exceeds `JIRA_MAX_BACKOFF`.
+        """
+        delay = self.get_backoff(attempt)
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                try:
+                    retry_after = parsedate_to_datetime(retry_after)
+                    delay = retry_after.timestamp() - time.time()
+                except (TypeError, ValueError):
+                    pass
+            if delay > settings.JIRA_MAX_BACKOFF:
+                return None
+            # A bit of jitter in order to not retry all the postponed
+            # requests at the same moment.
+            delay = max(delay, 0) + random.uniform(0, 1)
+        return delay
+
+    def request(self, method, uri, timeout=None, **kwargs):
+        """
+        Send a request and return the response of the last attempt.
+        """
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        url = f"{self.api_url}{uri}"
+        timeout = timeout or self.timeout
+        attempt = 0
+        endpoint = "{} {}".format(
+            method.upper(), metrics.get_endpoint_template(uri)
+        )
+        while True:
+            self.bucket.acquire()
+            started = time.monotonic()
+            try:
+                response = self.session.request(
+                    method, url, timeout=timeout, **kwargs
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                metrics.record(
+                    "jira", endpoint, time.monotonic() - started, error=True
+                )
+                if not idempotent or attempt >= self.max_retries:
+                    raise
+                delay = self.get_backoff(attempt)
+                logger.warning(
+                    f"{method} {uri} failed, retrying in {delay:.1f}s",
+                    exc_info=True,
+                )
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            status = response.status_code
+            metrics.record(
+                "jira",
+                endpoint,
+                time.monotonic() - started,
+                len(response.content),
+                status >= 400,
+            )
+            retryable = status == 429 or (
+                idempotent and status in RETRY_STATUSES
+            )
+            if not retryable or attempt >= self.max_retries:
+                return response
+            delay = self.get_retry_delay(response, attempt)
+            if delay is None:
+                logger.warning(
+                    f"{method} {uri} responded with {status}, not retrying: "
+                    f"Retry-After exceeds {settings.JIRA_MAX_BACKOFF}s"
+                )
+                return response
+            logger.warning(
+                f"{method} {uri} responded with {status}, "
+                f"retrying in {delay:.1f}s"
+            )
+            if status == 429:
+                self.bucket.pause(delay)
+            time.sleep(delay)
+            attempt += 1
+
+    def get(self, uri, timeout=None):
+        response = self.request("GET", uri, timeout=timeout)
+        if not response.ok:
+            if response.status_code in (400,):
+                # Raise an exception this way in order to provide more
+                # details located in `response.text`.
+                raise Exception(response.text)
+            else:
+                response.raise_for_status()
+        return response.json()
 
+    def post(self, uri, data, timeout=None):
+        response = self.request("POST", uri, timeout=timeout, json=data)
+        if not response.ok:
+            if response.status_code in (400,):
+                raise Exception(response.text)
+            else:
+                response.raise_for_status()
+        if response.text:
+            return response.json()
 
-session = requests.Session()
-session.auth = HTTPBasicAuth(settings.JIRA_USER_EMAIL, settings.JIRA_API_TOKEN)
-session.headers = {
-    "Accept": "application/json", "Content-Type": "application/json"
-}
 
+def get_client():
+    global client
+    if client is None:
+        with client_lock:
+            if client is None:
+                client = JiraClient(
+                    settings.JIRA_API_URL,
+                    settings.JIRA_USER_EMAIL,
+                    settings.JIRA_API_TOKEN,
+                    pool_size=settings.JIRA_POOL_SIZE,
+                    rate=settings.JIRA_RATE_LIMIT,
+                    burst=settings.JIRA_RATE_BURST,
+                    max_retries=settings.JIRA_MAX_RETRIES,
+                    timeout=settings.JIRA_TIMEOUT,
+                )
+    return client
 
-def jira_get_request(uri):
-    response = session.get(f"{settings.JIRA_API_URL}{uri}")
-    if not response.ok:
-        if response.status_code in (400,):
-            # Raise an exception this way in order to provide more
-            # details located in `response.text`.
-            raise Exception(response.text)
-        else:
-            response.raise_for_status()
-    return response.json()
 
+def jira_get_request(uri, timeout=None):
+    return get_client().get(uri, timeout=timeout)
 
-def jira_post_request(uri, data):
-    response = session.post(f"{settings.JIRA_API_URL}{uri}", json=data)
-    if not response.ok:
-        if response.status_code in (400,):
-            raise Exception(response.text)
-        else:
-            response.raise_for_status()
-    if response.text:
-        return response.json()
+
+def jira_post_request(uri, data, timeout=None):
+    return get_client().post(uri, data, timeout=timeout)
 
 
 def text2doc(text):
@@ -54,7 +222,7 @@ def text2doc(text):
     }
 
 
-def create_project(key, name):
+def create_project(key, name, lead_account_id=None):
     template_key = "com.pyxis.greenhopper.jira:gh-simplified-kanban-classic"
     data = {
         "name": name,
@@ -62,7 +230,7 @@ def create_project(key, name):
         "projectTemplateKey": template_key,
         "key": key.upper(),
         "assigneeType": "UNASSIGNED",
-        "leadAccountId": myself()["accountId"],
+        "leadAccountId": lead_account_id or myself()["accountId"],
     }
     jira_post_request('/project', data)
 
@@ -71,6 +239,10 @@ def get_project(project_key):
     return jira_get_request(f'/project/{project_key}')
 
 
+def get_projects():
+    return jira_get_request('/project')
+
+
 def server_info():
     return jira_get_request('/serverInfo')
 
@@ -89,6 +261,48 @@ def create_issue(fields):
     return jira_post_request('/issue', {'fields': fields})
 
 
+def create_issues(fields_list):
+    """
+    Create several issues by means of `/issue/bulk` endpoint. The
+    issues are sent in chunks of `JIRA_BULK_CHUNK_SIZE` items (Jira
+    doesn't accept more than 50 issues per request). Return a list of
+    the created issues in the same order as `fields_list`. An item of
+    the list is `None` if the corresponding issue wasn't created.
+    """
+    issues = []
+    chunk_size = settings.JIRA_BULK_CHUNK_SIZE
+    for i in range(0, len(fields_list), chunk_size):
+        chunk = fields_list[i:i + chunk_size]
+        issue_updates = []
+        for fields in chunk:
+            fields = dict(fields)
+            if 'description' in fields:
+                fields['description'] = text2doc(fields['description'])
+            issue_updates.append({'fields': fields})
+        response = get_client().request(
+            "POST", "/issue/bulk", json={'issueUpdates': issue_updates}
+        )
+        # Jira responds with 400 if none of the issues were created,
+        # the details are provided per item in `errors` anyway.
+        if not response.ok and response.status_code != 400:
+            response.raise_for_status()
+        resp = response.json()
+        errors = {
+            e['failedElementNumber']: e for e in resp.get('errors', [])
+        }
+        created = iter(resp.get('issues', []))
+        for n in range(len(chunk)):
+            if n in errors:
+                issues.append(None)
+                logger.error(
+                    f'Error occurred while creating an issue "'
+                    f'{chunk[n].get("summary")}": {errors[n]}'
+                )
+            else:
+                issues.append(next(created, None))
+    return issues
+
+
 def get_issue_transitions(issue_key):
     resp = jira_get_request(f'/issue/{issue_key}/transitions')
     return resp['transitions']
@@ -128,11 +342,95 @@ def get_fields():
     return jira_get_request('/field')
 
 
-def search_issues(jql):
+def search_issues(jql, start_at=0, max_results=50, fields=None, expand=None):
     jql = urllib.parse.quote(jql)
-    resp = jira_get_request(
-        f'/search?jql={jql}&startAt=0&validateQuery=True&maxResults=50')
-    return resp
+    uri = (
+        f'/search?jql={jql}&startAt={start_at}&validateQuery=True'
+        f'&maxResults={max_results}'
+    )
+    if fields is not None:
+        uri += '&fields=' + urllib.parse.quote(','.join(fields))
+    if expand:
+        uri += '&expand=' + urllib.parse.quote(','.join(expand))
+    return jira_get_request(uri)
+
+
+def search_issues_page(
+    jql,
+    max_results,
+    fields=None,
+    expand=None,
+    start_at=None,
+    next_page_token=None,
+):
+    """
+    Return a page of the search results by means of the search endpoint
+    (see `JIRA_SEARCH_ENDPOINT`). `/search/jql` endpoint continues the
+    search by `next_page_token`, `/search` endpoint by `start_at`.
+    """
+    params = {"jql": jql, "maxResults": max_results}
+    if start_at is not None:
+        params["startAt"] = start_at
+    if next_page_token:
+        params["nextPageToken"] = next_page_token
+    if fields is not None:
+        params["fields"] = ",".join(fields)
+    if expand:
+        params["expand"] = ",".join(expand)
+    query = urllib.parse.urlencode(params)
+    return jira_get_request(f"{settings.JIRA_SEARCH_ENDPOINT}?{query}")
+
+
+def iter_search_issues(
+    jql, fields=None, expand=None, page_size=None, concurrency=None
+):
+    """
+    Search the issues page by page and yield them one by one. Only the
+    given `fields` are returned (only the ids by `/search/jql` endpoint
+    if `fields` is `None`) and `expand` is a list of the entities to
+    expand, e.g. `["changelog"]`.
+
+    The pages are requested one after another by means of
+    `nextPageToken` of the previous page. If the endpoint responds with
+    the total number of the issues (`/search` endpoint) the rest of the
+    pages are requested concurrently, up to `concurrency` at a time,
+    and are yielded in order.
+    """
+    page_size = page_size or settings.JIRA_SEARCH_PAGE_SIZE
+    concurrency = concurrency or settings.JIRA_SEARCH_CONCURRENCY
+
+    def get_page(**kwargs):
+        return search_issues_page(
+            jql, page_size, fields=fields, expand=expand, **kwargs
+        )
+
+    resp = get_page()
+    yield from resp["issues"]
+    if "total" not in resp:
+        while resp.get("nextPageToken") and not resp.get("isLast"):
+            resp = get_page(next_page_token=resp["nextPageToken"])
+            yield from resp["issues"]
+        return
+
+    start_at = resp.get("startAt", 0) + len(resp["issues"])
+    if not resp["issues"] or start_at >= resp["total"]:
+        return
+    # A page may contain less issues than requested, so the offsets
+    # are based on the size of the first page.
+    step = len(resp["issues"])
+    offsets = iter(range(start_at, resp["total"], step))
+    with ThreadPoolExecutor(
+        max_workers=concurrency, thread_name_prefix="jira-search"
+    ) as executor:
+        pending = collections.deque(
+            executor.submit(get_page, start_at=offset)
+            for offset in itertools.islice(offsets, concurrency)
+        )
+        while pending:
+            issues = pending.popleft().result()["issues"]
+            for offset in itertools.islice(offsets, 1):
+                pending.append(executor.submit(get_page, start_at=offset))
+            yield from issues
 
 
 def create_issue_link_type(name, outward, inward):
@@ -0,0 +1,72 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from jpi import aio, settings
+from jpi.api import jira
+
+
+executor = None
+
+
+def get_executor():
+    """
+    Return the executor the Jira requests are sent from. Its size
+    bounds the number of the concurrent requests.
+    """
+    global executor
+    if executor is None:
+        executor = ThreadPoolExecutor(
+            max_workers=settings.JIRA_ASYNC_CONCURRENCY,
+            thread_name_prefix="jira",
+        )
+    return executor
+
+
+async def run(func, *args, **kwargs):
+    return await aio.run(func, *args, executor=get_executor(), **kwargs)
+
+
+async def get_issue(issue_key):
+    return await run(jira.get_issue, issue_key)
+
+
+async def create_issue(fields):
+    return await run(jira.create_issue, fields)
+
+
+async def create_issues(fields_list):
+    return await run(jira.create_issues, fields_list)
+
+
+async def get_issue_transitions(issue_key):
+    return await run(jira.get_issue_transitions, issue_key)
+
+
+async def transition_issue(issue_key, transition_id):
+    return await run(jira.transition_issue, issue_key, transition_id)
+
+
+async def mark_issue_as_done(issue_key):
+    return await run(jira.mark_issue_as_done, issue_key)
+
+
+async def create_issue_link(issue_link_type_name, inward, outward):
+    return await run(
+        jira.create_issue_link, issue_link_type_name, inward, outward
+    )
+
+
+async def get_fields():
+    return await run(jira.get_fields)
+
+
+async def search_issues(
+    jql, start_at=0, max_results=50, fields=None, expand=None
+):
+    return await run(
+        jira.search_issues,
+        jql,
+        start_at=start_at,
+        max_results=max_results,
+        fields=fields,
+        expand=expand,
+    )
@@ -0,0 +1,40 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from jpi import aio, settings, utils
+
+
+executor = None
+
+
+def get_executor():
+    """
+    Return the executor the PagerDuty requests are sent from. Its size
+    bounds the number of the concurrent requests.
+    """
+    global executor
+    if executor is None:
+        executor = ThreadPoolExecutor(
+            max_workers=settings.PAGERDUTY_ASYNC_CONCURRENCY,
+            thread_name_prefix="pagerduty",
+        )
+    return executor
+
+
+async def run(func, *args, **kwargs):
+    return await aio.run(func, *args, executor=get_executor(), **kwargs)
+
+
+async def get(path, **kwargs):
+    return await run(utils.get_pagerduty().get, path, **kwargs)
+
+
+async def rget(path, **kwargs):
+    return await run(utils.get_pagerduty().rget, path, **kwargs)
+
+
+async def rput(path, **kwargs):
+    return await run(utils.get_pagerduty().rput, path, **kwargs)
+
+
+async def rpost(path, **kwargs):
+    return await run(utils.get_pagerduty().rpost, path, **kwargs)
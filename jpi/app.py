@@ -1,19 +1,45 @@
 import logging
 
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, Response
 
-from jpi import webhooks
+from jpi import db, metrics, settings, webhook_queue, webhooks
 
 app = Flask(__name__)
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
+def enqueue_webhook(source):
+    """
+    Validate the webhook and put it to the queue, the webhook is handled
+    later by a worker (see `jpi.handlers.webhook_queue`).
+    """
+    payload = request.get_json(silent=True)
+    error = webhook_queue.validate_message(source, payload)
+    if error:
+        return jsonify({"ok": False, "error": error}), 400
+    try:
+        queue = webhook_queue.get_queue()
+        queue.send({"source": source, "payload": payload})
+    except Exception as e:
+        logger.exception(f"Error occurred while queueing a {source} webhook")
+        # Let the sender retry the webhook later.
+        return jsonify({"ok": False, "error": repr(e)}), 503
+    if settings.WEBHOOK_QUEUE_BACKEND == "sqlite":
+        from jpi.handlers.webhook_queue import process_message
+
+        queue.start_worker(process_message)
+    return jsonify({"ok": True}), 202
+
+
 @app.route("/pagerduty-webhook", methods=["POST"])
 def pagerduty_webhook():
+    if settings.WEBHOOK_QUEUE_BACKEND:
+        return enqueue_webhook("pagerduty")
     response = {"ok": True}
     try:
-        webhooks.pagerduty(request.json)
+        with db.incident_cache():
+            webhooks.pagerduty(request.json)
     except Exception as e:
         logger.exception(
             "Error occurred during processing of a PagerDuty webhook"
@@ -24,15 +50,34 @@ def pagerduty_webhook():
 
 @app.route("/jira-webhook", methods=["POST"])
 def jira_webhook():
+    if settings.WEBHOOK_QUEUE_BACKEND:
+        return enqueue_webhook("jira")
     response = {"ok": True}
     try:
-        webhooks.jira(request.json)
+        with db.incident_cache():
+            webhooks.jira(request.json)
     except Exception as e:
         logger.exception("Error occurred during processing of a Jira webhook")
         response = {"ok": False, "error": repr(e)}
     return jsonify(response)
 
 
+@app.after_request
+def flush_metrics(response):
+    metrics.flush()
+    return response
+
+
+if settings.METRICS_ROUTE:
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics_route():
+        return Response(
+            metrics.get_prometheus_text(),
+            mimetype="text/plain; version=0.0.4",
+        )
+
+
 try:
     # In some cases there is a need to use custom routes that are not
     # needed for the project but for development purposes only. If you
@@ -1,20 +1,69 @@
-from datetime import datetime
+import contextlib
+import contextvars
+from datetime import datetime, timedelta
+import threading
+import time
+import zlib
 
-import boto3
-from boto3.dynamodb.conditions import Attr, Key
 import pytz
 
-from jpi import settings
+from jpi import metrics, settings
 
 
-if settings.IS_OFFLINE:
-    resource = boto3.resource(
-        "dynamodb",
-        region_name="localhost",
-        endpoint_url=settings.DATABASE_ENDPOINT_URL,
-    )
-else:
-    resource = boto3.resource("dynamodb")
+local = threading.local()
+client = None
+resource_class = None
+client_lock = threading.Lock()
+# The incidents cache of the current request or invocation (see
+# `incident_cache`).
+incidents_cache = contextvars.ContextVar("incidents_cache", default=None)
+
+
+def get_client():
+    """
+    Return the low-level DynamoDB client shared by all the threads
+    (boto3 clients are thread safe). The client is created once, so
+    the short-lived worker threads (see `jpi.fanout`) don't pay for a
+    session, the service model and a connection pool of their own.
+    boto3 is imported on first use in order to not slow down the code
+    paths that don't use the database.
+    """
+    global client, resource_class
+    if client is None:
+        with client_lock:
+            if client is None:
+                import boto3
+
+                session = boto3.session.Session()
+                if settings.IS_OFFLINE:
+                    resource = session.resource(
+                        "dynamodb",
+                        region_name="localhost",
+                        endpoint_url=settings.DATABASE_ENDPOINT_URL,
+                    )
+                else:
+                    resource = session.resource("dynamodb")
+                metrics.instrument_boto3_client(
+                    resource.meta.client, "dynamodb"
+                )
+                resource_class = type(resource)
+                client = resource.meta.client
+    return client
+
+
+def get_resource():
+    """
+    Return a DynamoDB resource of the current thread. boto3 resources
+    are not thread safe, so every thread (e.g. a worker processing log
+    entries) gets its own one, but all of them wrap the shared client
+    (see `get_client`), so a resource is cheap to make.
+    """
+    resource = getattr(local, "resource", None)
+    if resource is None:
+        shared_client = get_client()
+        resource = resource_class(client=shared_client)
+        local.resource = resource
+    return resource
 
 
 def get_now():
@@ -22,29 +71,115 @@ def get_now():
     return str(now)
 
 
-def put_incident(incident_id, incident_fields=None):
+def get_projection(attributes):
+    """
+    Return `ProjectionExpression` and `ExpressionAttributeNames` in
+    order to read only the given attributes of an item.
+    """
+    names = {f"#a{i}": attribute for i, attribute in enumerate(attributes)}
+    return {
+        "ProjectionExpression": ", ".join(names),
+        "ExpressionAttributeNames": names,
+    }
+
+
+@contextlib.contextmanager
+def incident_cache():
+    """
+    Cache the incidents read or written within the context, e.g. while
+    a webhook request or a scheduled function invocation is being
+    handled. The cache is write-through: the incidents are written to
+    the database and to the cache. Nested contexts share the cache of
+    the outermost one.
+
+    The cache belongs to the current thread (or asyncio task), so
+    concurrent requests don't see each other's incidents. The workers
+    the incidents are handled by have to be run in a copy of the
+    context (see `contextvars.copy_context`) in order to share it.
+    """
+    token = None
+    if incidents_cache.get() is None:
+        token = incidents_cache.set({})
+    try:
+        yield
+    finally:
+        if token is not None:
+            incidents_cache.reset(token)
+
+
+def cache_incident(incident_id, incident):
+    """
+    Put the incident to the cache (if there is an active one). `None`
+    means that the incident doesn't exist in the database.
+    """
+    cache = incidents_cache.get()
+    if cache is not None:
+        cache[incident_id] = incident
+
+
+def put_incident(incident_id, incident_fields=None, condition=None):
+    """
+    Create or update the incident by means of a single `UpdateItem`
+    request, so concurrent updates of different fields don't override
+    each other. `condition` is an optional condition (e.g.
+    `Attr("resolved").not_exists()`) that should be met, otherwise
+    `ConditionalCheckFailedException` is raised. Return the attributes
+    of the updated incident.
+    """
     if incident_fields is None:
         incident_fields = {}
-    incidents_table = resource.Table(settings.INCIDENTS_TABLE)
-    incident = get_incident_by_id(incident_id)
-    if incident:
-        item = {**incident, **incident_fields, **{"updated": get_now()}}
-    else:
-        item = {
-            **{"incidentId": incident_id, "created": get_now()},
-            **incident_fields,
-        }
+    now = get_now()
+    names = {"#created": "created", "#updated": "updated"}
+    values = {":now": now}
+    actions = [
+        "#created = if_not_exists(#created, :now)",
+        "#updated = :now",
+    ]
+    for i, (field, value) in enumerate(incident_fields.items()):
+        if field in (settings.INCIDENT_ID_FIELD_NAME, "created", "updated"):
+            continue
+        names[f"#f{i}"] = field
+        values[f":f{i}"] = value
+        actions.append(f"#f{i} = :f{i}")
+    kwargs = {}
+    if condition is not None:
+        kwargs["ConditionExpression"] = condition
+    incidents_table = get_resource().Table(settings.INCIDENTS_TABLE)
+    response = incidents_table.update_item(
+        Key={settings.INCIDENT_ID_FIELD_NAME: incident_id},
+        UpdateExpression="SET " + ", ".join(actions),
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values,
+        ReturnValues="ALL_NEW",
+        **kwargs,
+    )
+    incident = response["Attributes"]
+    cache_incident(incident_id, incident)
+    return dict(incident)
+
 
-    return incidents_table.put_item(Item=item)
+def read_incident(incident_id):
+    """
+    Return the incident from the cache or read it from the database.
+    Only the attributes listed in `INCIDENT_ATTRIBUTES` are read.
+    """
+    cache = incidents_cache.get()
+    if cache is not None and incident_id in cache:
+        incident = cache[incident_id]
+        return dict(incident) if incident is not None else None
+    incidents = get_resource().Table(settings.INCIDENTS_TABLE)
+    response = incidents.get_item(
+        Key={settings.INCIDENT_ID_FIELD_NAME: incident_id},
+        **get_projection(settings.INCIDENT_ATTRIBUTES),
+    )
+    incident = response.get("Item")
+    cache_incident(incident_id, incident)
+    return dict(incident) if incident is not None else None
 
 
 def get_incident_by_id(incident_id, resolved=False):
-    incidents = resource.Table(settings.INCIDENTS_TABLE)
-    response = incidents.query(
-        KeyConditionExpression=Key("incidentId").eq(incident_id)
-    )
-    if response.get("Count", 0) > 0:
-        incident = response.get("Items")[0]
+    incident = read_incident(incident_id)
+    if incident:
         incident_resolved = incident.get(settings.RESOLVED_FIELD_NAME, False)
         if not resolved or not incident_resolved:
             return incident
@@ -57,34 +192,247 @@ def get_issue_key_by_incident_id(incident_id):
 
 
 def get_incident_id_by_issue_key(issue_key):
-    incidents = resource.Table(settings.INCIDENTS_TABLE)
-    response = incidents.scan(
-        FilterExpression=Attr(settings.ISSUE_KEY_FIELD_NAME).eq(issue_key)
+    from boto3.dynamodb.conditions import Key
+
+    incidents = get_resource().Table(settings.INCIDENTS_TABLE)
+    response = incidents.query(
+        IndexName=settings.INCIDENTS_ISSUE_KEY_INDEX,
+        KeyConditionExpression=Key(settings.ISSUE_KEY_FIELD_NAME).eq(
+            issue_key
+        ),
+        Limit=1,
     )
     if response.get("Count", 0) > 0:
         return response.get("Items")[0].get(settings.INCIDENT_ID_FIELD_NAME)
 
 
-def put_log_entry(log_entry_id):
-    log_entries = resource.Table(settings.LOG_ENTRIES_TABLE)
-    return log_entries.put_item(
-        Item={settings.LOG_ENTRY_ID_FIELD_NAME: log_entry_id}
-    )
+def parse_timestamp(timestamp):
+    """
+    Parse a timestamp returned by `get_now` (e.g. `2020-01-01
+    00:00:00.000000+00:00`) or by PagerDuty (e.g. `2020-01-01T00:00:00Z`).
+    """
+    ts = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    return ts.astimezone(pytz.utc)
+
+
+def get_log_entry_bucket(log_entry):
+    """
+    Return the start of the hour the log entry was created within.
+    """
+    ts = parse_timestamp(log_entry["created_at"])
+    return ts.replace(minute=0, second=0, microsecond=0)
 
 
-def get_log_entry_by_id(log_entry_id):
-    log_entries = resource.Table(settings.LOG_ENTRIES_TABLE)
-    response = log_entries.query(
-        KeyConditionExpression=Key(settings.LOG_ENTRY_ID_FIELD_NAME).eq(
-            log_entry_id
+def get_bucket_partition(log_entry_id):
+    """
+    Return the number of the item of a bucket the id of the log entry
+    is kept in (see `LOG_ENTRIES_BUCKET_PARTITIONS`). A stable hash is
+    used, so every invocation picks the same item.
+    """
+    partitions = settings.LOG_ENTRIES_BUCKET_PARTITIONS
+    return zlib.crc32(log_entry_id.encode()) % partitions
+
+
+def get_bucket_key(shard, bucket, partition):
+    return {
+        settings.LOG_ENTRY_ID_FIELD_NAME: "{}{}#{}#{}".format(
+            settings.LOG_ENTRIES_BUCKET_PREFIX,
+            shard,
+            bucket.strftime("%Y-%m-%dT%H"),
+            partition,
         )
+    }
+
+
+def get_bucket_items(log_entries):
+    """
+    Group the ids of the log entries by the items of the buckets they
+    are kept in. Return a dict that maps a tuple of the bucket and the
+    number of the item (see `get_bucket_partition`) to the set of the
+    ids.
+    """
+    items = {}
+    for log_entry in log_entries:
+        bucket = get_log_entry_bucket(log_entry)
+        partition = get_bucket_partition(log_entry["id"])
+        items.setdefault((bucket, partition), set()).add(log_entry["id"])
+    return items
+
+
+def get_bucket_expiration(bucket):
+    retention = settings.LOG_ENTRIES_DEDUP_RETENTION_HOURS + 1
+    return bucket + timedelta(hours=retention)
+
+
+def get_log_entries_horizon(now=None):
+    """
+    Return the high-water mark of the processed log entries: the
+    buckets that start before it are already expired (see
+    `get_bucket_expiration`), so all their entries, i.e. the ones
+    created more than `LOG_ENTRIES_DEDUP_RETENTION_HOURS` plus an hour
+    ago, are considered processed.
+    """
+    if now is None:
+        now = datetime.now(pytz.utc)
+    retention = settings.LOG_ENTRIES_DEDUP_RETENTION_HOURS + 1
+    return now - timedelta(hours=retention)
+
+
+def put_log_entry(shard, log_entry):
+    return put_log_entries(shard, [log_entry])
+
+
+def put_log_entries(shard, log_entries):
+    """
+    Mark the log entries of the shard as processed. The ids of the log
+    entries are added to the buckets (the items per hour the entries
+    were created within, see `get_bucket_items`) that expire in
+    `LOG_ENTRIES_DEDUP_RETENTION_HOURS` by means of DynamoDB TTL, so a
+    single request is sent per item.
+    """
+    log_entries_table = get_resource().Table(settings.LOG_ENTRIES_TABLE)
+    items = get_bucket_items(log_entries)
+    for (bucket, partition), log_entry_ids in sorted(items.items()):
+        expires_at = get_bucket_expiration(bucket).timestamp()
+        log_entries_table.update_item(
+            Key=get_bucket_key(shard, bucket, partition),
+            UpdateExpression="ADD #ids :ids SET #expiresAt = :expiresAt",
+            ExpressionAttributeNames={
+                "#ids": settings.LOG_ENTRY_IDS_FIELD_NAME,
+                "#expiresAt": settings.EXPIRES_AT_FIELD_NAME,
+            },
+            ExpressionAttributeValues={
+                ":ids": log_entry_ids,
+                ":expiresAt": int(expires_at),
+            },
+        )
+
+
+def batch_get_items(keys_by_table, attributes_by_table=None):
+    """
+    Read items from several tables by means of `BatchGetItem`.
+    `keys_by_table` maps a table name to a list of keys of the items
+    to read, `attributes_by_table` optionally maps a table name to a
+    list of the attributes to read. Return a dict that maps a table
+    name to a list of the found items. The keys are sent in chunks of
+    `DATABASE_BATCH_GET_SIZE` and the unprocessed keys (e.g. due to
+    throttling) are requested again.
+    """
+    if attributes_by_table is None:
+        attributes_by_table = {}
+    items = {table_name: [] for table_name in keys_by_table}
+    keys = [
+        (table_name, key)
+        for table_name, table_keys in keys_by_table.items()
+        for key in table_keys
+    ]
+    chunk_size = settings.DATABASE_BATCH_GET_SIZE
+    for i in range(0, len(keys), chunk_size):
+        request_items = {}
+        for table_name, key in keys[i:i + chunk_size]:
+            if table_name not in request_items:
+                request_items[table_name] = {"Keys": []}
+                if table_name in attributes_by_table:
+                    request_items[table_name].update(
+                        get_projection(attributes_by_table[table_name])
+                    )
+            request_items[table_name]["Keys"].append(key)
+        attempt = 0
+        while request_items:
+            if attempt:
+                time.sleep(min(0.05 * 2 ** attempt, 1))
+            response = get_resource().batch_get_item(
+                RequestItems=request_items
+            )
+            for table_name, table_items in response["Responses"].items():
+                items[table_name].extend(table_items)
+            request_items = response.get("UnprocessedKeys")
+            attempt += 1
+    return items
+
+
+def get_log_entries_state(shard, log_entries, incident_ids):
+    """
+    Return a set of the ids of the already processed log entries of the
+    shard among `log_entries` and a dict of the incidents among
+    `incident_ids` that exist in the database. Both are read by means
+    of batch requests: the items of the buckets of the log entries
+    (usually one or two hours per page of log entries, see
+    `get_bucket_items`) and the incidents that are not found in the
+    cache. The log entries of the buckets before the high-water mark
+    (see `get_log_entries_horizon`) are considered processed.
+
+    The log entries that aren't found in the buckets are looked up
+    among the items of the log entries processed before the buckets
+    were introduced (an item per log entry) unless
+    `LOG_ENTRIES_READ_LEGACY_ITEMS` is disabled.
+    """
+    log_entry_key = settings.LOG_ENTRY_ID_FIELD_NAME
+    log_entry_ids_key = settings.LOG_ENTRY_IDS_FIELD_NAME
+    incident_key = settings.INCIDENT_ID_FIELD_NAME
+    cache = incidents_cache.get()
+    if cache is None:
+        cache = {}
+    incidents = {
+        incident_id: dict(cache[incident_id])
+        for incident_id in incident_ids
+        if cache.get(incident_id) is not None
+    }
+    missing_ids = [i for i in incident_ids if i not in cache]
+
+    horizon = get_log_entries_horizon()
+    processed_ids = set()
+    bucket_items = []
+    for (bucket, partition), log_entry_ids in sorted(
+        get_bucket_items(log_entries).items()
+    ):
+        if bucket <= horizon:
+            processed_ids.update(log_entry_ids)
+        else:
+            bucket_items.append((bucket, partition))
+
+    items = batch_get_items(
+        {
+            settings.LOG_ENTRIES_TABLE: [
+                get_bucket_key(shard, bucket, partition)
+                for bucket, partition in bucket_items
+            ],
+            settings.INCIDENTS_TABLE: [
+                {incident_key: incident_id} for incident_id in missing_ids
+            ],
+        },
+        {
+            settings.LOG_ENTRIES_TABLE: [log_entry_key, log_entry_ids_key],
+            settings.INCIDENTS_TABLE: settings.INCIDENT_ATTRIBUTES,
+        },
     )
-    if response.get("Count", 0) > 0:
-        return response.get("Items")[0].get(settings.LOG_ENTRY_ID_FIELD_NAME)
+    for item in items[settings.LOG_ENTRIES_TABLE]:
+        processed_ids.update(item.get(log_entry_ids_key, ()))
+    unknown_ids = {e["id"] for e in log_entries} - processed_ids
+    if settings.LOG_ENTRIES_READ_LEGACY_ITEMS and unknown_ids:
+        legacy_items = batch_get_items(
+            {
+                settings.LOG_ENTRIES_TABLE: [
+                    {log_entry_key: log_entry_id}
+                    for log_entry_id in sorted(unknown_ids)
+                ],
+            },
+            {settings.LOG_ENTRIES_TABLE: [log_entry_key]},
+        )
+        processed_ids.update(
+            item[log_entry_key]
+            for item in legacy_items[settings.LOG_ENTRIES_TABLE]
+        )
+    for item in items[settings.INCIDENTS_TABLE]:
+        incidents[item[incident_key]] = item
+    for incident_id in missing_ids:
+        incident = incidents.get(incident_id)
+        cache_incident(incident_id, dict(incident) if incident else None)
+    return processed_ids, incidents
 
 
 def update_config_parameter(name, value):
-    config_table = resource.Table(settings.CONFIG_TABLE)
+    config_table = get_resource().Table(settings.CONFIG_TABLE)
     item = {
         settings.CONFIG_PARAMETER_FIELD_NAME: name,
         settings.CONFIG_VALUE_FIELD_NAME: value,
@@ -93,7 +441,9 @@ def update_config_parameter(name, value):
 
 
 def get_config_parameter(name):
-    config_table = resource.Table(settings.CONFIG_TABLE)
+    from boto3.dynamodb.conditions import Key
+
+    config_table = get_resource().Table(settings.CONFIG_TABLE)
     response = config_table.query(
         KeyConditionExpression=Key(settings.CONFIG_PARAMETER_FIELD_NAME).eq(
             name
@@ -101,3 +451,39 @@ def get_config_parameter(name):
     )
     if response.get("Count", 0) > 0:
         return response.get("Items")[0].get(settings.CONFIG_VALUE_FIELD_NAME)
+
+
+def delete_config_parameter(name):
+    config_table = get_resource().Table(settings.CONFIG_TABLE)
+    return config_table.delete_item(
+        Key={settings.CONFIG_PARAMETER_FIELD_NAME: name}
+    )
+
+
+def put_event(event_id, expires_at):
+    """
+    Put the event if it doesn't exist yet. Return `False` if the event
+    already exists. `expires_at` is a UNIX timestamp when the event is
+    deleted by DynamoDB TTL.
+    """
+    from boto3.dynamodb.conditions import Attr
+
+    events = get_resource().Table(settings.EVENTS_TABLE)
+    try:
+        events.put_item(
+            Item={
+                settings.EVENT_ID_FIELD_NAME: event_id,
+                settings.EXPIRES_AT_FIELD_NAME: int(expires_at),
+            },
+            ConditionExpression=Attr(
+                settings.EVENT_ID_FIELD_NAME
+            ).not_exists(),
+        )
+    except events.meta.client.exceptions.ConditionalCheckFailedException:
+        return False
+    return True
+
+
+def delete_event(event_id):
+    events = get_resource().Table(settings.EVENTS_TABLE)
+    return events.delete_item(Key={settings.EVENT_ID_FIELD_NAME: event_id})
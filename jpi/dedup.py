@@ -0,0 +1,69 @@
+import collections
+import logging
+import threading
+import time
+
+from jpi import db, settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class LRUSet:
+    """
+    A thread safe set that keeps up to `size` recently added items.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.items = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, item):
+        with self.lock:
+            if item in self.items:
+                self.items.move_to_end(item)
+                return True
+            return False
+
+    def add(self, item):
+        with self.lock:
+            self.items[item] = None
+            self.items.move_to_end(item)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def discard(self, item):
+        with self.lock:
+            self.items.pop(item, None)
+
+
+recent_events = LRUSet(settings.DEDUP_CACHE_SIZE)
+
+
+def claim_event(event_id):
+    """
+    Return `True` if the event is seen for the first time, i.e. it has
+    to be handled, and `False` if it is a duplicate. The recent events
+    are checked in memory, the rest by means of a conditional write to
+    the database, so concurrent deliveries of the same event are
+    handled only once. The events expire in `DEDUP_TTL_HOURS`.
+    """
+    if event_id in recent_events:
+        logger.info(f"[{event_id}] Duplicate event. Skipping...")
+        return False
+    expires_at = time.time() + settings.DEDUP_TTL_HOURS * 3600
+    is_new = db.put_event(event_id, expires_at)
+    recent_events.add(event_id)
+    if not is_new:
+        logger.info(f"[{event_id}] Duplicate event. Skipping...")
+    return is_new
+
+
+def release_event(event_id):
+    """
+    Forget the event, e.g. when it failed to be handled, so its next
+    delivery is handled again.
+    """
+    recent_events.discard(event_id)
+    db.delete_event(event_id)
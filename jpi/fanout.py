@@ -0,0 +1,69 @@
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+
+from jpi import settings
+
+
+class FanOutResult:
+    """
+    The outcome of the tasks run by `fan_out`: `results` of the
+    succeeded tasks and `errors` (the exceptions) of the failed ones by
+    the names of the tasks, in the order of the tasks.
+    """
+
+    def __init__(self):
+        self.results = {}
+        self.errors = {}
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def update(self, other):
+        self.results.update(other.results)
+        self.errors.update(other.errors)
+
+    def __repr__(self):
+        return "<FanOutResult succeeded={} failed={}>".format(
+            list(self.results), list(self.errors)
+        )
+
+
+def run(result, name, func, args):
+    try:
+        result.results[name] = func(*args)
+    except Exception as e:
+        result.errors[name] = e
+
+
+def fan_out(tasks, max_workers=None):
+    """
+    Run the independent `tasks` concurrently, at most `max_workers` (see
+    `FANOUT_CONCURRENCY`) at a time, and wait for all of them. `tasks`
+    is a list of `(name, func, args)` tuples. A failed task doesn't
+    stop the others, its exception is collected into the returned
+    `FanOutResult`.
+
+    Every call has its own threads, so a task may fan out as well. The
+    tasks are run in a copy of the context of the caller, so they share
+    e.g. its incidents cache (see `db.incident_cache`).
+    """
+    result = FanOutResult()
+    max_workers = min(max_workers or settings.FANOUT_CONCURRENCY, len(tasks))
+    if max_workers <= 1:
+        for name, func, args in tasks:
+            run(result, name, func, args)
+        return result
+    with ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="fanout"
+    ) as executor:
+        futures = [
+            (
+                name,
+                executor.submit(contextvars.copy_context().run, func, *args),
+            )
+            for name, func, args in tasks
+        ]
+    for name, future in futures:
+        run(result, name, future.result, ())
+    return result
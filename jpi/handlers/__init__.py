@@ -1 +1,3 @@
 from .log_entries import handler as log_entries  # noqa: F401
+from .log_entries_async import handler as log_entries_async  # noqa: F401
+from .webhook_queue import handler as webhook_queue  # noqa: F401
@@ -1,50 +1,103 @@
+import collections
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
 import datetime
 import logging
-import re
 from requests.exceptions import HTTPError
 
 from pdpyras import PDClientError
 import pytz
 
-from jpi import db, settings, utils
+from jpi import db, fanout, metrics, persons, settings, utils
 from jpi.api import jira
+from jpi.handlers import routing, shards
+from jpi.handlers.timeline import get_timeline_fields, TimelineBatch
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
-def handle_priority_change_log_entry(log_entry):
-    pattern = re.compile(r'Priority changed from "P\d" to "P1"')
-    if pattern.match(log_entry["summary"]):
-        logger.info("[{}] {}".format(log_entry["id"], log_entry["summary"]))
-        agent = log_entry["agent"]
-        incident = log_entry["incident"]
-        issue_key = db.get_issue_key_by_incident_id(incident["id"])
-        incident_fields = {
-            "priority": log_entry["channel"]["new_priority"]["summary"]
-        }
-        if not issue_key:
-            # Issue doesn't exist, let's create it.
-            incident_manager = utils.get_incident_manager(agent["summary"])
-            issue = utils.create_jira_incident(
-                incident["summary"], incident_manager=incident_manager
-            )
-            incident_fields[settings.ISSUE_KEY_FIELD_NAME] = issue['key']
-        db.put_incident(incident["id"], incident_fields)
+def get_issue_key(incident_id, incidents=None):
+    """
+    Return the key of the issue related to the incident. `incidents` is
+    a dict of the prefetched incidents; if it isn't provided the
+    incident is read from the database.
+    """
+    if incidents is None:
+        return db.get_issue_key_by_incident_id(incident_id)
+    incident = incidents.get(incident_id)
+    if incident:
+        return incident.get(settings.ISSUE_KEY_FIELD_NAME)
+
+
+def handle_priority_change_log_entry(
+    log_entry, incidents=None, shard_name=shards.DEFAULT_SHARD
+):
+    """
+    Handle a change of priority to P1 (see `routing.PRIORITY_CHANGE`).
+    The shard of the log entry is kept with the incident, so it is
+    resolved in the PagerDuty account of the shard.
+    """
+    logger.info("[{}] {}".format(log_entry["id"], log_entry["summary"]))
+    agent = log_entry["agent"]
+    incident = log_entry["incident"]
+    issue_key = get_issue_key(incident["id"], incidents)
+    incident_fields = {
+        "priority": log_entry["channel"]["new_priority"]["summary"],
+        settings.SHARD_FIELD_NAME: shard_name,
+    }
+    if not issue_key:
+        # Issue doesn't exist, let's create it.
+        incident_manager = utils.get_incident_manager(agent["summary"])
+        issue = utils.create_jira_incident(
+            incident["summary"], incident_manager=incident_manager
+        )
+        incident_fields[settings.ISSUE_KEY_FIELD_NAME] = issue['key']
+    updated = db.put_incident(incident["id"], incident_fields)
+    if incidents is not None:
+        incidents[incident["id"]] = updated
 
 
-def handle_log_entry(log_entry):
+def handle_log_entry(
+    log_entry,
+    incidents=None,
+    timeline=None,
+    actions=None,
+    shard_name=shards.DEFAULT_SHARD,
+):
+    """
+    Handle a log entry of the shard. If `timeline` batch is provided,
+    the timeline item of the log entry is added to it instead of being
+    created immediately. `actions` are the actions of the log entry if
+    it is routed already (see `partition_log_entries`).
+    """
     logger.info("[{}] New log entry found".format(log_entry["id"]))
 
-    if log_entry["type"] == "priority_change_log_entry":
-        logger.info("[{}] Priority changed".format(log_entry["id"]))
-        handle_priority_change_log_entry(log_entry)
+    if actions is None:
+        actions = routing.route(log_entry)
+    for action in actions:
+        if action == routing.PRIORITY_CHANGE:
+            logger.info("[{}] Priority changed".format(log_entry["id"]))
+            handle_priority_change_log_entry(
+                log_entry, incidents, shard_name
+            )
+        elif action == routing.TIMELINE:
+            handle_timeline_log_entry(log_entry, incidents, timeline)
+
 
-    issue_key = db.get_issue_key_by_incident_id(log_entry["incident"]["id"])
+def handle_timeline_log_entry(log_entry, incidents=None, timeline=None):
+    """
+    Mirror the log entry to the timeline of the related Jira issue (see
+    `routing.TIMELINE`).
+    """
+    issue_key = get_issue_key(log_entry["incident"]["id"], incidents)
     if issue_key:
         logger.info(
             "[{}] Related issue found: {}".format(log_entry["id"], issue_key)
         )
+        if timeline is not None:
+            timeline.add(log_entry, issue_key)
+            return
         try:
             jira.get_issue(issue_key)
         except HTTPError:
@@ -52,13 +105,8 @@ def handle_log_entry(log_entry):
             logger.exception(msg.format(log_entry["id"]))
             return
 
-        fields = {
-            "project": {"key": settings.TIMELINE_PROJECT_KEY},
-            "summary": log_entry["summary"],
-            "issuetype": {"name": settings.TIMELINE_PROJECT_KEY.title()},
-        }
         try:
-            timeline_issue = jira.create_issue(fields)
+            timeline_issue = jira.create_issue(get_timeline_fields(log_entry))
             logger.info(
                 'Timeline issue "{}" successfully created'.format(
                     timeline_issue['key']
@@ -73,48 +121,344 @@ def handle_log_entry(log_entry):
             msg = "[{}] Error creating timeline link to Jira issue {}"
             logger.exception(msg.format(issue_key))
             return
-        db.put_log_entry(log_entry["id"])
+        db.put_log_entry(shards.DEFAULT_SHARD, log_entry)
     else:
         logger.info("[{}] Issue key not found".format(log_entry["id"]))
 
 
-def handler(event, context):
-    result = {"ok": True}
-    pagerduty = utils.get_pagerduty()
-    polling_timestamp = utils.last_polling_timestamp()
+def process_incident_log_entries(
+    log_entries, incidents, timeline=None, shard_name=shards.DEFAULT_SHARD
+):
+    """
+    Process the log entries of a single incident (a list of tuples of
+    a log entry and its actions) one by one, i.e. in the order they were
+    received from PagerDuty. The processing of the incident stops at
+    the first failed entry in order to not break the order of the
+    entries. Return the ids of the handled log entries.
+    """
+    handled_ids = []
+    for log_entry, actions in log_entries:
+        try:
+            handle_log_entry(
+                log_entry, incidents, timeline, actions, shard_name
+            )
+        except Exception:
+            msg = "[{}] Error occurred while processing a log entry"
+            logger.exception(msg.format(log_entry["id"]))
+            break
+        handled_ids.append(log_entry["id"])
+    return handled_ids
+
+
+def partition_log_entries(log_entries, shard_name=shards.DEFAULT_SHARD):
+    """
+    Skip the log entries that aren't routed anywhere (see `routing`)
+    and the already processed ones of the shard and group the rest by
+    incident. Return the groups and a dict of the related incidents. A
+    group is a list of tuples of a log entry and its actions, so the log
+    entries aren't routed again.
+
+    The state of the log entries and their incidents is read from the
+    database in advance by means of a few batch requests, so there is
+    no need to read it while handling every single log entry.
+    """
+    actions = {}
+    for log_entry in log_entries:
+        log_entry_actions = routing.route(log_entry)
+        if log_entry_actions:
+            actions[log_entry["id"]] = log_entry_actions
+    log_entries = [e for e in log_entries if e["id"] in actions]
+    if not log_entries:
+        return [], {}
+    processed_ids, incidents = db.get_log_entries_state(
+        shard_name,
+        log_entries,
+        {e["incident"]["id"] for e in log_entries},
+    )
+    partitions = collections.OrderedDict()
+    for log_entry in log_entries:
+        if log_entry["id"] in processed_ids:
+            # Usually should not happens as far as we read items from
+            # our last polling call
+            msg = "[{}] Existing log entry found. Skipping..."
+            logger.info(msg.format(log_entry["id"]))
+            continue
+        incident_id = log_entry["incident"]["id"]
+        partitions.setdefault(incident_id, []).append(
+            (log_entry, actions[log_entry["id"]])
+        )
+    return list(partitions.values()), incidents
+
+
+def process_log_entries(log_entries, shard_name=shards.DEFAULT_SHARD):
+    """
+    Process the log entries of the shard by means of
+    `LOG_ENTRIES_WORKERS` workers. The log entries are partitioned by
+    incident, so the entries of the same incident are processed in
+    order by a single worker while the entries of different incidents
+    are processed in parallel.
+
+    The timeline items of the log entries are collected and created in
+    batches once all the log entries are handled. Return the ids of the
+    processed log entries (see `get_processed_ids`).
+    """
+    partitions, incidents = partition_log_entries(log_entries, shard_name)
+    timeline = TimelineBatch(shard_name)
+    workers = min(settings.LOG_ENTRIES_WORKERS, len(partitions))
+    handled_ids = []
+    if workers <= 1:
+        for partition in partitions:
+            handled_ids.extend(process_incident_log_entries(
+                partition, incidents, timeline, shard_name
+            ))
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    contextvars.copy_context().run,
+                    process_incident_log_entries,
+                    partition,
+                    incidents,
+                    timeline,
+                    shard_name,
+                )
+                for partition in partitions
+            ]
+            for future in futures:
+                handled_ids.extend(future.result())
+    return get_processed_ids(log_entries, partitions, handled_ids, timeline)
+
+
+def get_processed_ids(log_entries, partitions, handled_ids, timeline):
+    """
+    Create the timeline items of `timeline` batch and return the ids of
+    the log entries that are processed: the ones skipped as processed
+    before, the handled ones that don't have a timeline item and the
+    ones whose timeline item is created.
+    """
+    partitioned_ids = {
+        e["id"] for partition in partitions for e, _ in partition
+    }
+    skipped_ids = {e["id"] for e in log_entries} - partitioned_ids
+    timeline_ids = timeline.get_log_entry_ids()
+    created_ids = timeline.flush()
+    return (
+        skipped_ids | (set(handled_ids) - timeline_ids) | set(created_ids)
+    )
+
+
+def update_cursor_watermark(cursor, log_entries, processed_ids, now=None):
+    """
+    Keep track of the log entries of the polling in the cursor:
+    `watermark` is the creation time of the latest processed log entry
+    and `pending` is the creation time of the earliest log entry that
+    failed to be processed. A log entry that still fails
+    `LOG_ENTRIES_RETRY_HOURS` after it was created (e.g. its issue is
+    deleted) is given up, so it doesn't hold the polling back forever.
+    """
+    if now is None:
+        now = datetime.datetime.now(pytz.utc)
+    retry_until = now - datetime.timedelta(
+        hours=settings.LOG_ENTRIES_RETRY_HOURS
+    )
+    for log_entry in log_entries:
+        created_at = db.parse_timestamp(log_entry["created_at"])
+        if log_entry["id"] in processed_ids:
+            key, pick = "watermark", max
+        elif created_at < retry_until:
+            logger.error(
+                "[{}] The log entry is given up, it failed to be "
+                "processed for {} hours".format(
+                    log_entry["id"], settings.LOG_ENTRIES_RETRY_HOURS
+                )
+            )
+            continue
+        else:
+            key, pick = "pending", min
+        if cursor.get(key):
+            created_at = pick(created_at, db.parse_timestamp(cursor[key]))
+        cursor[key] = str(created_at)
+
+
+def get_polling_watermark(cursor):
+    """
+    Return the timestamp the next polling should start from (minus the
+    overlap): the earliest log entry that failed to be processed, so it
+    is processed again, or the latest processed one. If there are no
+    new log entries, the polling moves forward up to the overlap before
+    the end of the polling.
+    """
+    if cursor.get("pending"):
+        return cursor["pending"]
+    overlap = datetime.timedelta(minutes=settings.LOG_ENTRIES_OVERLAP_MINUTES)
+    timestamps = [
+        db.parse_timestamp(cursor["since"]) + overlap,
+        db.parse_timestamp(cursor["until"]) - overlap,
+    ]
+    if cursor.get("watermark"):
+        timestamps.append(db.parse_timestamp(cursor["watermark"]))
+    return str(max(timestamps))
+
+
+def get_log_entry_page(pagerduty, params, offset):
+    """
+    Fetch a page of the log entries starting from `offset`. Return a
+    tuple with the offset of the next page, the list of the log entries
+    of the page and a flag whether there are more pages.
+    """
+    page_params = {
+        **params,
+        "offset": offset,
+        "limit": settings.LOG_ENTRIES_PAGE_SIZE,
+    }
+    response = pagerduty.get(settings.LOG_ENTRIES_ENDPOINT, params=page_params)
+    if not response.ok:
+        raise PDClientError(
+            "Error reading a page of Log Entries (offset: {})".format(offset),
+            response=response,
+        )
+    body = response.json()
+    log_entries = body.get("log_entries", [])
+    more = bool(body.get("more") and log_entries)
+    return offset + len(log_entries), log_entries, more
+
+
+def iter_log_entry_pages(pagerduty, params, offset=0):
+    """
+    Fetch the log entries page by page starting from `offset`. Yield
+    a tuple with the offset of the next page and the list of the log
+    entries of the current page, so only a single page is kept in
+    memory at a time.
+    """
+    more = True
+    while more:
+        offset, log_entries, more = get_log_entry_page(
+            pagerduty, params, offset
+        )
+        yield offset, log_entries
+
+
+def get_polling_cursor(shard):
+    """
+    Return the cursor of the polling of the shard that was interrupted
+    or a new one that starts `LOG_ENTRIES_OVERLAP_MINUTES` before the
+    last polling timestamp of the shard.
+    """
+    cursor = utils.last_polling_cursor(shard.cursor_param)
+    if cursor:
+        cursor["offset"] = int(cursor["offset"])
+        msg = (
+            "[{shard}] Resuming polling from {since} to {until} at "
+            "offset {offset}"
+        )
+        logger.info(msg.format(shard=shard.name, **cursor))
+        return cursor
+
+    polling_timestamp = utils.last_polling_timestamp(shard.timestamp_param)
     if not polling_timestamp:
         now = datetime.datetime.now(pytz.utc)
         ts = now - datetime.timedelta(
             hours=settings.LOG_ENTRIES_POLL_PAST_HOURS
         )
     else:
-        ts = datetime.datetime.strptime(
-            polling_timestamp, "%Y-%m-%d %H:%M:%S.%f%z"
+        ts = db.parse_timestamp(polling_timestamp) - datetime.timedelta(
+            minutes=settings.LOG_ENTRIES_OVERLAP_MINUTES
         )
+    cursor = {"since": str(ts), "until": db.get_now(), "offset": 0}
+    utils.update_polling_cursor(cursor, shard.cursor_param)
+    return cursor
 
-    params = {"since": str(ts)}
-    processing_timestamp = db.get_now()
-    utils.update_polling_timestamp(processing_timestamp)
-    try:
-        log_entries = list(
-            pagerduty.iter_all(settings.LOG_ENTRIES_ENDPOINT, params=params)
+
+def get_shard_query_params(shard, cursor):
+    return {
+        "since": cursor["since"],
+        "until": cursor["until"],
+        **routing.get_query_params(),
+        **shard.get_query_params(),
+    }
+
+
+def get_polling_result(results):
+    """
+    Return the result of the polling of the shards: the result of the
+    default shard as is if it is the only one. If a shard failed with
+    an exception, the exception is raised once all the shards are
+    polled.
+    """
+    for name, error in results.errors.items():
+        logger.error(
+            f"[{name}] Error occurred while polling log entries",
+            exc_info=error,
         )
+    if results.errors:
+        raise next(iter(results.errors.values()))
+    if list(results.results) == [shards.DEFAULT_SHARD]:
+        return results.results[shards.DEFAULT_SHARD]
+    return {
+        "ok": all(result["ok"] for result in results.results.values()),
+        "shards": results.results,
+    }
+
+
+def handler(event, context):
+    """
+    Poll the log entries of all the shards (see `jpi.handlers.shards`)
+    or of the ones listed in `shards` of the event, e.g. the input of
+    a schedule.
+    """
+    try:
+        with db.incident_cache():
+            return poll_log_entries((event or {}).get("shards"))
+    finally:
+        metrics.flush()
+
+
+def poll_log_entries(shard_names=None):
+    """
+    Poll the shards in parallel by means of `LOG_ENTRIES_SHARD_WORKERS`
+    workers, so a slow shard doesn't hold the others back.
+    """
+    try:
+        persons.refresh_directory()
+    except Exception:
+        logger.exception("Error occurred while refreshing person directory")
+    results = fanout.fan_out(
+        [
+            (shard.name, poll_shard, (shard,))
+            for shard in shards.get_shards(shard_names)
+        ],
+        max_workers=settings.LOG_ENTRIES_SHARD_WORKERS,
+    )
+    return get_polling_result(results)
+
+
+def poll_shard(shard):
+    result = {"ok": True}
+    pagerduty = shard.get_pagerduty()
+    cursor = get_polling_cursor(shard)
+    params = get_shard_query_params(shard, cursor)
+    try:
+        pages = iter_log_entry_pages(pagerduty, params, cursor["offset"])
+        for offset, log_entries in pages:
+            log_entries = shard.filter_log_entries(log_entries)
+            logger.info("[{}] {} log entries found".format(
+                shard.name, len(log_entries)
+            ))
+            processed_ids = process_log_entries(log_entries, shard.name)
+            # The page is processed, so a retried invocation should
+            # start from the next one.
+            cursor["offset"] = offset
+            update_cursor_watermark(cursor, log_entries, processed_ids)
+            utils.update_polling_cursor(cursor, shard.cursor_param)
     except PDClientError:
         msg = "Error reading Log Entries from PagerDuty instance"
         result["ok"] = False
         result["error"] = msg
-        logger.exception(msg)
+        logger.exception(f"[{shard.name}] {msg}")
     else:
-        logger.info("{} log entries found".format(len(log_entries)))
-        for log_entry in log_entries:
-            if db.get_log_entry_by_id(log_entry["id"]):
-                # Usually should not happens as far as we read items from
-                # our last polling call
-                msg = "[{}] Existing log entry found. Skipping..."
-                logger.info(msg.format(log_entry["id"]))
-                continue
-            handle_log_entry(log_entry)
-
-    # anyway put last timestamp the the db at the end of last issues polling
+        utils.update_polling_timestamp(
+            get_polling_watermark(cursor), shard.timestamp_param
+        )
+        utils.delete_polling_cursor(shard.cursor_param)
 
     return result
@@ -0,0 +1,208 @@
+import asyncio
+import logging
+
+from pdpyras import PDClientError
+
+from jpi import aio, db, metrics, persons, settings, utils
+from jpi.api import jira_async, pagerduty_async
+from jpi.fanout import FanOutResult
+from jpi.handlers.log_entries import (
+    get_issue_key,
+    get_log_entry_page,
+    get_polling_cursor,
+    get_polling_result,
+    get_polling_watermark,
+    get_processed_ids,
+    get_shard_query_params,
+    handle_timeline_log_entry,
+    partition_log_entries,
+    update_cursor_watermark,
+)
+from jpi.handlers import routing, shards
+from jpi.handlers.timeline import TimelineBatch
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+async def handle_priority_change_log_entry_async(
+    log_entry, incidents, shard_name
+):
+    """
+    An asynchronous version of `handle_priority_change_log_entry`.
+    """
+    logger.info("[{}] {}".format(log_entry["id"], log_entry["summary"]))
+    agent = log_entry["agent"]
+    incident = log_entry["incident"]
+    issue_key = get_issue_key(incident["id"], incidents)
+    incident_fields = {
+        "priority": log_entry["channel"]["new_priority"]["summary"],
+        settings.SHARD_FIELD_NAME: shard_name,
+    }
+    if not issue_key:
+        # Issue doesn't exist, let's create it.
+        incident_manager = await aio.run(
+            utils.get_incident_manager, agent["summary"]
+        )
+        issue = await utils.create_jira_incident_async(
+            incident["summary"], incident_manager=incident_manager
+        )
+        incident_fields[settings.ISSUE_KEY_FIELD_NAME] = issue['key']
+    incidents[incident["id"]] = await aio.run(
+        db.put_incident, incident["id"], incident_fields
+    )
+
+
+async def handle_log_entry_async(
+    log_entry, incidents, timeline, actions, shard_name
+):
+    """
+    An asynchronous version of `handle_log_entry`, the timeline item of
+    the log entry is always added to `timeline` batch.
+    """
+    logger.info("[{}] New log entry found".format(log_entry["id"]))
+
+    for action in actions:
+        if action == routing.PRIORITY_CHANGE:
+            logger.info("[{}] Priority changed".format(log_entry["id"]))
+            await handle_priority_change_log_entry_async(
+                log_entry, incidents, shard_name
+            )
+        elif action == routing.TIMELINE:
+            handle_timeline_log_entry(log_entry, incidents, timeline)
+
+
+async def process_incident_log_entries_async(
+    log_entries, incidents, timeline, shard_name
+):
+    """
+    An asynchronous version of `process_incident_log_entries`.
+    """
+    handled_ids = []
+    for log_entry, actions in log_entries:
+        try:
+            await handle_log_entry_async(
+                log_entry, incidents, timeline, actions, shard_name
+            )
+        except Exception:
+            msg = "[{}] Error occurred while processing a log entry"
+            logger.exception(msg.format(log_entry["id"]))
+            break
+        handled_ids.append(log_entry["id"])
+    return handled_ids
+
+
+async def process_log_entries_async(
+    log_entries, shard_name=shards.DEFAULT_SHARD
+):
+    """
+    Process the log entries of different incidents concurrently, the
+    entries of the same incident are processed in order. The timeline
+    items are created in batches once all the log entries are handled.
+    Return the ids of the processed log entries.
+    """
+    partitions, incidents = await aio.run(
+        partition_log_entries, log_entries, shard_name
+    )
+    timeline = TimelineBatch(shard_name)
+    results = await asyncio.gather(*[
+        process_incident_log_entries_async(
+            partition, incidents, timeline, shard_name
+        )
+        for partition in partitions
+    ])
+    handled_ids = [i for handled_ids in results for i in handled_ids]
+    return await jira_async.run(
+        get_processed_ids, log_entries, partitions, handled_ids, timeline
+    )
+
+
+async def poll_log_entries_async(shard_names=None):
+    """
+    An asynchronous version of `poll_log_entries`, the shards are
+    polled concurrently.
+    """
+    try:
+        await jira_async.run(persons.refresh_directory)
+    except Exception:
+        logger.exception("Error occurred while refreshing person directory")
+    selected = await aio.run(shards.get_shards, shard_names)
+    outcomes = await asyncio.gather(
+        *[poll_shard_async(shard) for shard in selected],
+        return_exceptions=True,
+    )
+    results = FanOutResult()
+    for shard, outcome in zip(selected, outcomes):
+        if isinstance(outcome, Exception):
+            results.errors[shard.name] = outcome
+        else:
+            results.results[shard.name] = outcome
+    return get_polling_result(results)
+
+
+async def poll_shard_async(shard):
+    """
+    An asynchronous version of `poll_shard`. The next page of log
+    entries is fetched while the current one is being processed.
+    """
+    result = {"ok": True}
+    pagerduty = shard.get_pagerduty()
+    cursor = await aio.run(get_polling_cursor, shard)
+    params = get_shard_query_params(shard, cursor)
+    next_page = asyncio.ensure_future(pagerduty_async.run(
+        get_log_entry_page, pagerduty, params, cursor["offset"]
+    ))
+    try:
+        while next_page:
+            offset, log_entries, more = await next_page
+            next_page = None
+            if more:
+                next_page = asyncio.ensure_future(pagerduty_async.run(
+                    get_log_entry_page, pagerduty, params, offset
+                ))
+            log_entries = shard.filter_log_entries(log_entries)
+            logger.info("[{}] {} log entries found".format(
+                shard.name, len(log_entries)
+            ))
+            processed_ids = await process_log_entries_async(
+                log_entries, shard.name
+            )
+            # The page is processed, so a retried invocation should
+            # start from the next one.
+            cursor["offset"] = offset
+            update_cursor_watermark(cursor, log_entries, processed_ids)
+            await aio.run(
+                utils.update_polling_cursor, cursor, shard.cursor_param
+            )
+    except PDClientError:
+        msg = "Error reading Log Entries from PagerDuty instance"
+        result["ok"] = False
+        result["error"] = msg
+        logger.exception(f"[{shard.name}] {msg}")
+    else:
+        await aio.run(
+            utils.update_polling_timestamp,
+            get_polling_watermark(cursor),
+            shard.timestamp_param,
+        )
+        await aio.run(utils.delete_polling_cursor, shard.cursor_param)
+    finally:
+        if next_page:
+            next_page.cancel()
+
+    return result
+
+
+def handler(event, context):
+    """
+    An asynchronous version of `jpi.handlers.log_entries.handler`: the
+    Jira and PagerDuty calls of different incidents overlap instead of
+    waiting on each other.
+    """
+    try:
+        with db.incident_cache():
+            return asyncio.run(
+                poll_log_entries_async((event or {}).get("shards"))
+            )
+    finally:
+        metrics.flush()
@@ -0,0 +1,92 @@
+import re
+
+from jpi import settings
+
+
+PRIORITY_CHANGE = "priority_change"
+TIMELINE = "timeline"
+
+P1_PRIORITY_CHANGE_PATTERN = re.compile(r'Priority changed from "P\d" to "P1"')
+
+
+class Rule:
+    """
+    A rule that routes the log entries of the given `types` (all the
+    types if `None`) whose summary matches `pattern` (if provided) to
+    `action`.
+    """
+
+    def __init__(self, action, types=None, pattern=None):
+        self.action = action
+        self.types = tuple(types) if types else None
+        self.pattern = pattern
+
+    def matches(self, log_entry):
+        if self.pattern is None:
+            return True
+        return bool(self.pattern.match(log_entry.get("summary") or ""))
+
+
+def get_rules():
+    """
+    Return the routing rules in the order their actions are applied:
+
+    - a change of priority to P1 creates a Jira issue of the incident;
+    - the log entries of `LOG_ENTRIES_MIRROR_TYPES` (all types if not
+      configured) are mirrored to the timeline of the Jira issue.
+    """
+    return [
+        Rule(
+            PRIORITY_CHANGE,
+            types=["priority_change_log_entry"],
+            pattern=P1_PRIORITY_CHANGE_PATTERN,
+        ),
+        Rule(TIMELINE, types=settings.LOG_ENTRIES_MIRROR_TYPES),
+    ]
+
+
+def get_routing_table(rules):
+    """
+    Return a dict that maps a log entry type to the rules of the type
+    and a list of the rules that apply to all types.
+    """
+    rules_by_type = {}
+    common_rules = []
+    for rule in rules:
+        if rule.types is None:
+            common_rules.append(rule)
+            for type_rules in rules_by_type.values():
+                type_rules.append(rule)
+            continue
+        for log_entry_type in rule.types:
+            type_rules = rules_by_type.setdefault(
+                log_entry_type, list(common_rules)
+            )
+            type_rules.append(rule)
+    return rules_by_type, common_rules
+
+
+rules_by_type, common_rules = get_routing_table(get_rules())
+
+
+def route(log_entry):
+    """
+    Return the list of the actions to apply to the log entry. An empty
+    list means that the log entry should be skipped.
+    """
+    rules = rules_by_type.get(log_entry["type"], common_rules)
+    return [rule.action for rule in rules if rule.matches(log_entry)]
+
+
+def get_query_params():
+    """
+    Return the query parameters of `/log_entries` endpoint that make
+    PagerDuty filter the log entries on its side. PagerDuty doesn't
+    filter by type, so the types are filtered by `route`.
+    """
+    params = {}
+    if settings.LOG_ENTRIES_IS_OVERVIEW:
+        params["is_overview"] = "true"
+    if settings.LOG_ENTRIES_INCLUDE:
+        params["include[]"] = settings.LOG_ENTRIES_INCLUDE
+    return params
@@ -0,0 +1,182 @@
+import json
+import os
+
+from jpi import settings, utils
+
+
+DEFAULT_SHARD = "default"
+
+shards = None
+
+
+class Shard:
+    """
+    A part of the log entries that is polled independently of the
+    others: the log entries of a PagerDuty account (the default one if
+    `api_token` is `None`), optionally of the given services and teams
+    only. Every shard has its own polling timestamp and cursor in the
+    config table, the default shard keeps the names of a single
+    polling.
+
+    PagerDuty filters the log entries by teams, but not by services, so
+    the log entries of the other services are fetched and dropped by
+    `filter_log_entries`.
+    """
+
+    def __init__(self, name, api_token=None, service_ids=(), team_ids=()):
+        self.name = name
+        self.api_token = api_token
+        self.service_ids = list(service_ids)
+        self.team_ids = list(team_ids)
+
+    def __repr__(self):
+        return f"<Shard {self.name}>"
+
+    def get_param_name(self, name):
+        if self.name == DEFAULT_SHARD:
+            return name
+        return f"{name}#{self.name}"
+
+    @property
+    def timestamp_param(self):
+        return self.get_param_name(settings.LAST_POLLING_TIMESTAMP_PARAM)
+
+    @property
+    def cursor_param(self):
+        return self.get_param_name(settings.POLLING_CURSOR_PARAM)
+
+    def get_account(self):
+        return self.api_token or settings.PAGERDUTY_API_TOKEN
+
+    def get_pagerduty(self):
+        return utils.get_pagerduty(self.api_token)
+
+    def get_query_params(self):
+        """
+        Return the query parameters of `/log_entries` requests that
+        filter the log entries of the shard.
+        """
+        if self.team_ids:
+            return {"team_ids[]": self.team_ids}
+        return {}
+
+    def get_team_service_ids(self):
+        """
+        Return the ids of the services of the teams of the shard.
+        """
+        services = self.get_pagerduty().iter_all(
+            "services", params={"team_ids[]": self.team_ids}
+        )
+        return [service["id"] for service in services]
+
+    def filter_log_entries(self, log_entries):
+        """
+        Return the log entries of the services of the shard.
+        """
+        if not self.service_ids:
+            return log_entries
+        service_ids = set(self.service_ids)
+        return [
+            log_entry for log_entry in log_entries
+            if (log_entry.get("service") or {}).get("id") in service_ids
+        ]
+
+
+def check_overlaps(shards):
+    """
+    Raise an exception if the shards of the same account may poll the
+    same log entries, since they would be processed twice concurrently:
+    a shard of the whole account has to be its only shard, the shards
+    of services and of teams can't be mixed (a service belongs to
+    teams) and a service or a team belongs to a single shard. A service
+    may belong to several teams, so the services of the teams of the
+    team shards are fetched once to check that they don't overlap
+    either.
+    """
+    by_account = {}
+    for shard in shards:
+        by_account.setdefault(shard.get_account(), []).append(shard)
+    for account_shards in by_account.values():
+        if len(account_shards) < 2:
+            continue
+        names = ", ".join(f'"{shard.name}"' for shard in account_shards)
+        if any(not (s.service_ids or s.team_ids) for s in account_shards):
+            raise Exception(
+                f"Log entries shards {names} overlap: a shard without "
+                f"`serviceIds` and `teamIds` polls the whole account"
+            )
+        if any(s.service_ids for s in account_shards) and any(
+            s.team_ids for s in account_shards
+        ):
+            raise Exception(
+                f"Log entries shards {names} overlap: the shards of an "
+                f"account are either by `serviceIds` or by `teamIds`"
+            )
+        owners = {}
+        for shard in account_shards:
+            object_ids = shard.service_ids + shard.team_ids
+            if shard.team_ids:
+                object_ids += shard.get_team_service_ids()
+            for object_id in dict.fromkeys(object_ids):
+                owner = owners.setdefault(object_id, shard.name)
+                if owner != shard.name:
+                    raise Exception(
+                        f'Log entries shards "{owner}" and "{shard.name}" '
+                        f'overlap: both of them contain "{object_id}"'
+                    )
+
+
+def load_shards():
+    """
+    Load the shards from `LOG_ENTRIES_SHARDS_FILE`, a JSON list of
+    objects with `name` and optional `apiTokenVariable` (the name of an
+    environment variable with the API token of the account),
+    `serviceIds` and `teamIds`. There is a single default shard if the
+    file isn't set. The shards may not overlap (see `check_overlaps`).
+    """
+    if not settings.LOG_ENTRIES_SHARDS_FILE:
+        return [Shard(DEFAULT_SHARD)]
+    path = os.path.join(
+        settings.PROJECT_PATH, settings.LOG_ENTRIES_SHARDS_FILE
+    )
+    with open(path) as f:
+        definitions = json.load(f)
+    loaded = []
+    for definition in definitions:
+        name = definition["name"]
+        if any(shard.name == name for shard in loaded):
+            raise Exception(f'Duplicate log entries shard "{name}"')
+        api_token = None
+        if definition.get("apiTokenVariable"):
+            api_token = os.environ.get(definition["apiTokenVariable"])
+            if not api_token:
+                raise Exception(
+                    f'`{definition["apiTokenVariable"]}` setting of "{name}" '
+                    f'log entries shard is not defined'
+                )
+        loaded.append(Shard(
+            name,
+            api_token=api_token,
+            service_ids=definition.get("serviceIds", ()),
+            team_ids=definition.get("teamIds", ()),
+        ))
+    check_overlaps(loaded)
+    return loaded
+
+
+def get_shards(names=None):
+    """
+    Return all the shards or the ones with the given names, e.g. the
+    shards polled by an invocation of the scheduled function.
+    """
+    global shards
+    if shards is None:
+        shards = load_shards()
+    if names is None:
+        return shards
+    unknown = set(names) - {shard.name for shard in shards}
+    if unknown:
+        raise Exception(
+            f"Unknown log entries shards: {', '.join(sorted(unknown))}"
+        )
+    return [shard for shard in shards if shard.name in names]
@@ -0,0 +1,115 @@
+import logging
+import threading
+from requests.exceptions import HTTPError
+
+from jpi import db, fanout, settings
+from jpi.api import jira
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class TimelineBatch:
+    """
+    Collect the timeline items of the log entries of a shard and create
+    them all at once:
+
+    - every related issue is checked only once;
+    - the timeline issues are created by means of the bulk endpoint;
+    - the created issues are linked to the related issues concurrently
+      (see `FANOUT_CONCURRENCY`);
+    - the log entries are marked as processed at once (see
+      `db.put_log_entries`).
+
+    Only the log entries whose timeline issues were created are marked
+    as processed, the rest will be handled again by the next polling.
+    """
+
+    def __init__(self, shard_name):
+        self.shard_name = shard_name
+        self.items = []
+        self.lock = threading.Lock()
+
+    def add(self, log_entry, issue_key):
+        with self.lock:
+            self.items.append((log_entry, issue_key))
+
+    def get_log_entry_ids(self):
+        with self.lock:
+            return {log_entry["id"] for log_entry, _ in self.items}
+
+    def get_existing_issue_keys(self, issue_keys):
+        existing = set()
+        for issue_key in issue_keys:
+            try:
+                jira.get_issue(issue_key)
+            except HTTPError:
+                msg = "Error occurred while retrieving Jira issue {}"
+                logger.exception(msg.format(issue_key))
+            else:
+                existing.add(issue_key)
+        return existing
+
+    def flush(self):
+        """
+        Create the collected timeline items. Return the list of the ids
+        of the log entries that were processed.
+        """
+        with self.lock:
+            items, self.items = self.items, []
+        if not items:
+            return []
+
+        existing = self.get_existing_issue_keys(
+            sorted({issue_key for _, issue_key in items})
+        )
+        items = [item for item in items if item[1] in existing]
+        try:
+            timeline_issues = jira.create_issues(
+                [get_timeline_fields(log_entry) for log_entry, _ in items]
+            )
+        except HTTPError:
+            logger.exception("Error occurred while creating timeline issues")
+            return []
+
+        created = []
+        for (log_entry, issue_key), timeline_issue in zip(
+            items, timeline_issues
+        ):
+            if timeline_issue:
+                logger.info(
+                    '[{}] Timeline issue "{}" successfully created'.format(
+                        log_entry["id"], timeline_issue['key']
+                    )
+                )
+                created.append((log_entry, issue_key, timeline_issue))
+
+        link_type = settings.TIMELINE_ISSUE_TYPE_NAME
+        result = fanout.fan_out([
+            (
+                log_entry["id"],
+                jira.create_issue_link,
+                (link_type, issue_key, timeline_issue['key']),
+            )
+            for log_entry, issue_key, timeline_issue in created
+        ])
+        for log_entry, issue_key, _ in created:
+            error = result.errors.get(log_entry["id"])
+            if error:
+                msg = "[{}] Error creating timeline link to Jira issue {}"
+                logger.error(
+                    msg.format(log_entry["id"], issue_key) + f": {error!r}"
+                )
+
+        db.put_log_entries(
+            self.shard_name, [log_entry for log_entry, _, _ in created]
+        )
+        return [log_entry["id"] for log_entry, _, _ in created]
+
+
+def get_timeline_fields(log_entry):
+    return {
+        "project": {"key": settings.TIMELINE_PROJECT_KEY},
+        "summary": log_entry["summary"],
+        "issuetype": {"name": settings.TIMELINE_PROJECT_KEY.title()},
+    }
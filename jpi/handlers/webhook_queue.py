@@ -0,0 +1,65 @@
+import json
+import logging
+
+from jpi import db, metrics, resolver, webhook_queue, webhooks
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+HANDLERS = {
+    "pagerduty": webhooks.pagerduty,
+    "jira": webhooks.jira,
+}
+
+
+def process_message(message):
+    """
+    Handle a queued webhook, `message` is a dict with the `source` of
+    the webhook and its `payload`.
+    """
+    with db.incident_cache():
+        HANDLERS[message["source"]](message["payload"])
+
+
+def handler(event, context):
+    """
+    Handle the webhooks received from SQS queue. The failed messages are
+    reported back to SQS, so only they are received again. A message
+    fails if its handling raises an exception or an incident it
+    resolves isn't resolved.
+    """
+    handled = []
+    # The incidents resolved by the records are resolved in bulk once
+    # all the records are handled.
+    with resolver.get_resolver().batched() as futures:
+        for record in event.get("Records", []):
+            submitted = len(futures)
+            try:
+                process_message(json.loads(record["body"]))
+            except Exception:
+                msg = "[{}] Error occurred while processing a queued webhook"
+                logger.exception(msg.format(record["messageId"]))
+                handled.append((record["messageId"], None))
+            else:
+                handled.append((record["messageId"], futures[submitted:]))
+    failures = []
+    for message_id, record_futures in handled:
+        if record_futures is not None and any(
+            future.exception() is not None for future in record_futures
+        ):
+            msg = "[{}] Error occurred while resolving a queued webhook"
+            logger.error(msg.format(message_id))
+            record_futures = None
+        if record_futures is None:
+            failures.append({"itemIdentifier": message_id})
+    metrics.flush()
+    return {"batchItemFailures": failures}
+
+
+if __name__ == "__main__":
+    # Drain the local (SQLite) queue, e.g. when the local server is not
+    # running.
+    logging.basicConfig(level=logging.INFO)
+    queue = webhook_queue.get_queue()
+    while queue.drain(process_message):
+        pass
@@ -0,0 +1,170 @@
+from datetime import datetime, timedelta
+import logging
+import threading
+
+import pytz
+
+from jpi import db, settings
+from jpi.api import jira
+
+
+FIELDS = "fields"
+ISSUE_TYPES = "issueTypes"
+LINK_TYPES = "linkTypes"
+DONE_TRANSITIONS = "doneTransitions"
+
+# The metadata read from the config table or loaded from Jira by this
+# process, by the name of an entry. The lock guards the dict only, the
+# requests are sent without it.
+entries = {}
+entries_lock = threading.Lock()
+logger = logging.getLogger(__name__)
+
+
+def get_parameter_name(name):
+    return f"{settings.JIRA_METADATA_PARAM}.{name}"
+
+
+def get_age(entry):
+    return datetime.now(pytz.utc) - db.parse_timestamp(entry["loaded"])
+
+
+def is_expired(entry):
+    return get_age(entry) > timedelta(hours=settings.JIRA_METADATA_TTL_HOURS)
+
+
+def save(name, value):
+    entry = {"loaded": db.get_now(), "value": value}
+    db.update_config_parameter(get_parameter_name(name), entry)
+    with entries_lock:
+        entries[name] = entry
+    return entry
+
+
+def get_entry(name, load):
+    with entries_lock:
+        entry = entries.get(name)
+    if entry is not None and not is_expired(entry):
+        return entry
+    entry = db.get_config_parameter(get_parameter_name(name))
+    if entry is None or is_expired(entry):
+        logger.info(f'Loading Jira metadata "{name}"')
+        return save(name, load())
+    with entries_lock:
+        entries[name] = entry
+    return entry
+
+
+def get(name, load):
+    """
+    Return the value of the entry `name`. The entry is read from the
+    config table once per process and is loaded from Jira by means of
+    `load()` only if there is no entry yet or it is expired (see
+    `JIRA_METADATA_TTL_HOURS`).
+    """
+    return get_entry(name, load)["value"]
+
+
+def find(value, key):
+    if isinstance(value, dict):
+        return value.get(key)
+    return True if key in value else None
+
+
+def lookup(name, load, key):
+    """
+    Return `key` of the value of the entry `name` (`True` if a list
+    contains it) or `None`. If the key is missing, e.g. the type of
+    link has just been created by the configuration tool, the entry is
+    loaded from Jira again, but at most once per
+    `JIRA_METADATA_RELOAD_INTERVAL` seconds.
+    """
+    entry = get_entry(name, load)
+    found = find(entry["value"], key)
+    interval = timedelta(seconds=settings.JIRA_METADATA_RELOAD_INTERVAL)
+    if found is None and get_age(entry) >= interval:
+        logger.info(f'Reloading Jira metadata "{name}": "{key}" is missing')
+        found = find(save(name, load())["value"], key)
+    return found
+
+
+def invalidate(name):
+    """
+    Forget the entry `name`, e.g. when Jira rejects a request because
+    of the stale metadata, so it is loaded from Jira on next access.
+    """
+    logger.info(f'Jira metadata "{name}" invalidated')
+    with entries_lock:
+        entries.pop(name, None)
+    db.delete_config_parameter(get_parameter_name(name))
+
+
+def invalidate_all():
+    for name in (FIELDS, ISSUE_TYPES, LINK_TYPES, DONE_TRANSITIONS):
+        invalidate(name)
+
+
+def load_fields():
+    fields = {}
+    for field in jira.get_fields():
+        fields.setdefault(field["name"], field["id"])
+    return fields
+
+
+def load_issue_types():
+    return sorted({t["name"] for t in jira.get_issue_types()})
+
+
+def load_link_types():
+    return sorted({t["name"] for t in jira.get_issue_link_types()})
+
+
+def get_field_id(name):
+    """
+    Return `id` of the field with the given name or `None`.
+    """
+    return lookup(FIELDS, load_fields, name)
+
+
+def has_issue_type(name):
+    return bool(lookup(ISSUE_TYPES, load_issue_types, name))
+
+
+def has_link_type(name):
+    return bool(lookup(LINK_TYPES, load_link_types, name))
+
+
+def get_workflow(issue_key):
+    """
+    Return the workflow of the issue. Every project of the integration
+    has a single issue type, so the workflow is identified by the key
+    of the project.
+    """
+    return issue_key.rsplit("-", 1)[0]
+
+
+def get_done_transition_id(issue_key):
+    """
+    Return `id` of "Done" transition of the workflow of the issue. The
+    transitions are fetched from Jira once per workflow.
+    """
+    workflow = get_workflow(issue_key)
+    transitions = get(DONE_TRANSITIONS, dict)
+    if workflow in transitions:
+        return transitions[workflow]
+    transition_id = next(
+        (
+            t["id"] for t in jira.get_issue_transitions(issue_key)
+            if t["name"] == "Done"
+        ),
+        None,
+    )
+    if transition_id is None:
+        # The issue is probably done already, the transitions of the
+        # workflow are unknown.
+        return None
+    # Another workflow saved concurrently may be lost, then it is
+    # fetched again.
+    transitions = get(DONE_TRANSITIONS, dict)
+    save(DONE_TRANSITIONS, {**transitions, workflow: transition_id})
+    return transition_id
@@ -0,0 +1,237 @@
+import json
+import re
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+from jpi import settings
+
+
+# The upper bounds (in seconds) of the buckets of latency histograms.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# CloudWatch doesn't accept more than 100 values of a metric per line.
+MAX_EMF_VALUES = 100
+
+# The path segments replaced in the endpoint templates, e.g.
+# `/issue/INCIDENT-1/transitions` becomes `/issue/{key}/transitions`.
+PATH_SEGMENT_PATTERNS = (
+    (re.compile(r"^[A-Z][A-Z0-9_]*-\d+$"), "{key}"),
+    (re.compile(r"^\d+$"), "{id}"),
+    (re.compile(r"^P[A-Z0-9]{5,}$"), "{id}"),
+)
+
+metrics = {}
+metrics_lock = threading.Lock()
+
+
+class Metric:
+    """
+    The calls of a single endpoint of a dependency: the number of calls
+    and errors, the number of the received bytes and a histogram of the
+    latency. The latencies since the last `flush` are kept as well in
+    order to be written as CloudWatch EMF.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.bytes = 0
+        self.latency_sum = 0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.flushed = (0, 0, 0)
+        self.latencies = []
+
+    def add(self, seconds, size, error):
+        self.count += 1
+        self.errors += int(error)
+        self.bytes += size
+        self.latency_sum += seconds
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        if len(self.latencies) < MAX_EMF_VALUES:
+            self.latencies.append(round(seconds * 1000, 3))
+
+
+def get_endpoint_template(path):
+    """
+    Return the path with the ids of the objects replaced by
+    placeholders, so the calls of the same endpoint are counted
+    together.
+    """
+    segments = []
+    for segment in path.split("?")[0].split("/"):
+        for pattern, placeholder in PATH_SEGMENT_PATTERNS:
+            if pattern.match(segment):
+                segment = placeholder
+                break
+        segments.append(segment)
+    return "/".join(segments)
+
+
+def record(dependency, endpoint, seconds, size=0, error=False):
+    """
+    Record a call of `endpoint` of `dependency` (`jira`, `pagerduty` or
+    `dynamodb`) that took `seconds` and received `size` bytes.
+    """
+    with metrics_lock:
+        metric = metrics.get((dependency, endpoint))
+        if metric is None:
+            metric = metrics[(dependency, endpoint)] = Metric()
+        metric.add(seconds, size, error)
+
+
+def instrument_session(session, dependency):
+    """
+    Record the requests of a `requests` session, e.g. the PagerDuty
+    `APISession`.
+    """
+
+    def hook(response, *args, **kwargs):
+        request = response.request
+        endpoint = "{} {}".format(
+            request.method, get_endpoint_template(urlparse(request.url).path)
+        )
+        record(
+            dependency,
+            endpoint,
+            response.elapsed.total_seconds(),
+            len(response.content or b""),
+            response.status_code >= 400,
+        )
+
+    session.hooks["response"].append(hook)
+
+
+def instrument_boto3_client(client, dependency):
+    """
+    Record the requests of a boto3 client by operation, e.g. `Query`.
+    """
+
+    def before_call(context, **kwargs):
+        context["metrics_started"] = time.monotonic()
+
+    def after_call(http_response, model, context, **kwargs):
+        started = context.get("metrics_started")
+        if started is None:
+            return
+        size = 0
+        error = False
+        if http_response is not None:
+            size = len(http_response.content or b"")
+            error = http_response.status_code >= 400
+        record(
+            dependency, model.name, time.monotonic() - started, size, error
+        )
+
+    service = client.meta.service_model.service_id.hyphenize()
+    client.meta.events.register(f"before-call.{service}", before_call)
+    client.meta.events.register(f"after-call.{service}", after_call)
+
+
+def flush():
+    """
+    Write the calls recorded since the previous flush to stdout as
+    CloudWatch embedded metric format (EMF) lines, a line per endpoint,
+    if `METRICS_EMF` is enabled. Should be called at the end of every
+    invocation of a function.
+    """
+    with metrics_lock:
+        lines = []
+        for (dependency, endpoint), metric in sorted(metrics.items()):
+            count, errors, size = metric.flushed
+            if metric.count == count:
+                continue
+            lines.append(get_emf_line(
+                dependency,
+                endpoint,
+                metric.count - count,
+                metric.errors - errors,
+                metric.bytes - size,
+                metric.latencies,
+            ))
+            metric.flushed = (metric.count, metric.errors, metric.bytes)
+            metric.latencies = []
+    if settings.METRICS_EMF:
+        for line in lines:
+            sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+
+def get_emf_line(dependency, endpoint, count, errors, size, latencies):
+    return json.dumps({
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": settings.METRICS_NAMESPACE,
+                "Dimensions": [["Dependency", "Endpoint"]],
+                "Metrics": [
+                    {"Name": "Calls", "Unit": "Count"},
+                    {"Name": "Errors", "Unit": "Count"},
+                    {"Name": "Bytes", "Unit": "Bytes"},
+                    {"Name": "Latency", "Unit": "Milliseconds"},
+                ],
+            }],
+        },
+        "Dependency": dependency,
+        "Endpoint": endpoint,
+        "Calls": count,
+        "Errors": errors,
+        "Bytes": size,
+        "Latency": latencies,
+    })
+
+
+COUNTERS = (
+    ("jpi_requests_total", "Requests sent to the dependencies.", "count"),
+    ("jpi_request_errors_total", "Failed requests.", "errors"),
+    ("jpi_response_bytes_total", "Bytes received in responses.", "bytes"),
+)
+
+
+def get_labels(dependency, endpoint, **extra):
+    labels = {"dependency": dependency, "endpoint": endpoint, **extra}
+    return ",".join(
+        '{}="{}"'.format(name, escape_label_value(value))
+        for name, value in labels.items()
+    )
+
+
+def escape_label_value(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def get_prometheus_text():
+    """
+    Return all the recorded calls in Prometheus text exposition format.
+    """
+    with metrics_lock:
+        snapshot = sorted(
+            (key, dict(vars(metric), buckets=list(metric.buckets)))
+            for key, metric in metrics.items()
+        )
+    lines = []
+    for name, description, attribute in COUNTERS:
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} counter")
+        for (dependency, endpoint), metric in snapshot:
+            labels = get_labels(dependency, endpoint)
+            lines.append(f"{name}{{{labels}}} {metric[attribute]}")
+
+    name = "jpi_request_duration_seconds"
+    lines.append(f"# HELP {name} Latency of the requests.")
+    lines.append(f"# TYPE {name} histogram")
+    for (dependency, endpoint), metric in snapshot:
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, metric["buckets"]):
+            cumulative += count
+            labels = get_labels(dependency, endpoint, le=str(bound))
+            lines.append(f"{name}_bucket{{{labels}}} {cumulative}")
+        labels = get_labels(dependency, endpoint, le="+Inf")
+        lines.append(f"{name}_bucket{{{labels}}} {metric['count']}")
+        labels = get_labels(dependency, endpoint)
+        lines.append(f"{name}_sum{{{labels}}} {metric['latency_sum']}")
+        lines.append(f"{name}_count{{{labels}}} {metric['count']}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,182 @@
+from datetime import datetime, timedelta
+import logging
+import threading
+import time
+
+import pytz
+
+from jpi import db, settings
+from jpi.api import jira
+
+
+# JQL dates are interpreted in the time zone of the Jira user, so the
+# persons updated a bit earlier than the last synchronization are
+# fetched again.
+SYNC_OVERLAP = timedelta(days=1)
+
+directory = None
+directory_read_at = None
+reloaded_at = None
+reload_lock = threading.Lock()
+logger = logging.getLogger(__name__)
+
+
+def normalize(fullname):
+    return " ".join(fullname.casefold().split())
+
+
+def add_persons(persons, jql):
+    """
+    Add the persons found by `jql` to `persons`. The former name of a
+    renamed person is removed. Return `True` if `persons` is changed.
+    """
+    changed = False
+    names = {person["key"]: name for name, person in persons.items()}
+    issues = jira.iter_search_issues(
+        jql, fields=["summary"], page_size=settings.PERSON_DIRECTORY_PAGE_SIZE
+    )
+    for issue in issues:
+        name = normalize(issue["fields"]["summary"] or "")
+        former_name = names.pop(issue["key"], None)
+        if former_name is not None and former_name != name:
+            del persons[former_name]
+            changed = True
+        if name:
+            names[issue["key"]] = name
+            person = {
+                "key": issue["key"],
+                "summary": issue["fields"]["summary"],
+            }
+            if persons.get(name) != person:
+                persons[name] = person
+                changed = True
+    return changed
+
+
+def save_directory(new_directory):
+    global directory, directory_read_at
+    db.update_config_parameter(
+        settings.PERSON_DIRECTORY_PARAM, new_directory
+    )
+    directory = new_directory
+    directory_read_at = time.monotonic()
+    return directory
+
+
+def load_directory():
+    """
+    Load all the persons from Jira and save the snapshot.
+    """
+    now = datetime.now(pytz.utc)
+    persons = {}
+    add_persons(persons, f"project={settings.PERSON_PROJECT_KEY}")
+    logger.info(f"Person directory loaded: {len(persons)} persons")
+    return save_directory(
+        {"loaded": str(now), "lastSync": str(now), "persons": persons}
+    )
+
+
+def refresh_directory():
+    """
+    Fetch the persons updated since the last synchronization or reload
+    the directory completely if its snapshot is expired. The complete
+    reload (once per `PERSON_DIRECTORY_TTL_HOURS`) drops the deleted
+    persons, which the updated ones can't tell about. The snapshot is
+    written only if a person is changed: it holds all the persons, so
+    every write costs as many write units as its size. Until then the
+    last synchronization stays where it is and the same persons are
+    fetched again, which is bounded by the complete reload.
+    """
+    global directory, directory_read_at
+    snapshot = db.get_config_parameter(settings.PERSON_DIRECTORY_PARAM)
+    now = datetime.now(pytz.utc)
+    ttl = timedelta(hours=settings.PERSON_DIRECTORY_TTL_HOURS)
+    if not snapshot or db.parse_timestamp(snapshot["loaded"]) + ttl < now:
+        return load_directory()
+
+    last_sync = db.parse_timestamp(snapshot["lastSync"]) - SYNC_OVERLAP
+    last_sync = last_sync.strftime("%Y/%m/%d %H:%M")
+    persons = snapshot["persons"]
+    changed = add_persons(
+        persons,
+        f'project={settings.PERSON_PROJECT_KEY} '
+        f'and updated >= "{last_sync}"',
+    )
+    if not changed:
+        directory = snapshot
+        directory_read_at = time.monotonic()
+        return directory
+    return save_directory({**snapshot, "lastSync": str(now)})
+
+
+def reload_directory():
+    """
+    Refresh the directory on the request path, e.g. if there is no
+    snapshot yet or a person isn't found. It is done by a single thread
+    at a time and at most once per `PERSON_DIRECTORY_RELOAD_INTERVAL`
+    seconds, so unknown names don't send every request to Jira. Return
+    `True` if the directory is refreshed.
+    """
+    global reloaded_at
+    now = time.monotonic()
+    interval = settings.PERSON_DIRECTORY_RELOAD_INTERVAL
+    if reloaded_at is not None and now - reloaded_at < interval:
+        return False
+    if not reload_lock.acquire(blocking=False):
+        return False
+    try:
+        reloaded_at = now
+        refresh_directory()
+    finally:
+        reload_lock.release()
+    return True
+
+
+def get_directory():
+    """
+    Return the directory. Its snapshot is read from the config table
+    at most once per `PERSON_DIRECTORY_READ_INTERVAL` seconds; the
+    persons are loaded from Jira only if there is no snapshot yet (see
+    `reload_directory`).
+    """
+    global directory, directory_read_at
+    interval = settings.PERSON_DIRECTORY_READ_INTERVAL
+    if (
+        directory is None
+        or time.monotonic() - directory_read_at > interval
+    ):
+        snapshot = db.get_config_parameter(settings.PERSON_DIRECTORY_PARAM)
+        if snapshot:
+            directory = snapshot
+            directory_read_at = time.monotonic()
+        elif directory is None:
+            reload_directory()
+        else:
+            directory_read_at = time.monotonic()
+    return directory or {"persons": {}}
+
+
+def lookup(persons, name):
+    person = persons.get(name)
+    if person is None:
+        person = next(
+            (p for n, p in sorted(persons.items()) if name in n), None
+        )
+    return person
+
+
+def find_person(fullname):
+    """
+    Return a person by the full name. If there is no person with
+    exactly the same (normalized) name, return the first person whose
+    name contains it. The directory is refreshed once a person isn't
+    found (see `reload_directory`).
+    """
+    name = normalize(fullname)
+    if not name:
+        return None
+    person = lookup(get_directory()["persons"], name)
+    if person is None and reload_directory():
+        person = lookup(get_directory()["persons"], name)
+    if person:
+        return {"key": person["key"], "fields": {"summary": person["summary"]}}
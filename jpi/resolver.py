@@ -0,0 +1,209 @@
+from concurrent.futures import Future, wait
+import contextlib
+import logging
+import threading
+
+from pdpyras import PDClientError
+
+from jpi import settings, utils
+
+
+logger = logging.getLogger(__name__)
+
+
+class Resolver:
+    """
+    Resolve PagerDuty incidents in bulk. The incidents submitted within
+    `window` seconds, or until there are `batch_size` of them, are
+    resolved by means of a single `PUT /incidents` request. A resolved
+    incident is marked as resolved in the database as well (see
+    `utils.resolve_incident`).
+
+    A thread that submits the incidents within `batched()` context
+    doesn't wait for the window: the incidents are resolved at the
+    exit of the context, e.g. once all the records of an SQS batch
+    are handled.
+
+    The incidents are resolved in the PagerDuty accounts of the log
+    entries shards they were created by (see `get_pagerduty`), a request
+    per account.
+
+    If PagerDuty rejects a request (400 Bad Request) because of an
+    invalid incident, the incidents of the request are resolved one by
+    one, so the rest of them are resolved anyway. Any other error fails
+    all the incidents of the request.
+    """
+
+    def __init__(self, window, batch_size):
+        self.window = window
+        self.batch_size = batch_size
+        self.pending = []
+        self.lock = threading.Lock()
+        self.timer = None
+        self.local = threading.local()
+
+    def submit(self, incident_id, shard_name=None):
+        """
+        Return a future of the resolved incident.
+        """
+        future = Future()
+        batched = getattr(self.local, "futures", None)
+        with self.lock:
+            self.pending.append((incident_id, shard_name, future))
+            is_full = len(self.pending) >= self.batch_size
+            if (
+                not is_full
+                and batched is None
+                and self.window > 0
+                and self.timer is None
+            ):
+                self.timer = threading.Timer(self.window, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+        if batched is not None:
+            batched.append(future)
+        elif is_full or self.window <= 0:
+            self.flush()
+        return future
+
+    def flush(self):
+        """
+        Resolve all the submitted incidents.
+        """
+        with self.lock:
+            pending, self.pending = self.pending, []
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        by_shard = {}
+        for incident_id, shard_name, future in pending:
+            by_shard.setdefault(shard_name, []).append((incident_id, future))
+        for shard_name, batch in by_shard.items():
+            for i in range(0, len(batch), self.batch_size):
+                self.send(batch[i:i + self.batch_size], shard_name)
+
+    def resolve(self, incident_id, callback, shard_name=None):
+        """
+        Resolve the incident of the shard and call `callback(future)`
+        once it is done. Block until then unless the current thread is
+        within `batched()` context.
+        """
+        future = self.submit(incident_id, shard_name)
+        future.add_done_callback(callback)
+        if getattr(self.local, "futures", None) is None:
+            wait([future])
+        return future
+
+    def send(self, batch, shard_name=None):
+        references = [
+            {
+                "id": incident_id,
+                "type": "incident_reference",
+                "status": settings.STATUS_RESOLVED,
+            }
+            for incident_id in dict.fromkeys(i for i, _ in batch)
+        ]
+        try:
+            incidents = get_pagerduty(shard_name).rput(
+                settings.INCIDENT_ENDPOINT, json=references
+            )
+        except Exception as e:
+            if len(references) > 1 and is_bad_request(e):
+                # PagerDuty rejects the whole request because of a
+                # single invalid incident, find it out.
+                logger.warning(
+                    f"Error occurred while resolving {len(references)} "
+                    f"incidents in bulk, resolving them one by one: {e!r}"
+                )
+                for incident_id, future in batch:
+                    self.send([(incident_id, future)], shard_name)
+                return
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        resolved = {
+            incident["id"]: incident for incident in incidents
+            if incident.get("status") == settings.STATUS_RESOLVED
+        }
+        futures_by_id = {}
+        for incident_id, future in batch:
+            if not future.done():
+                futures_by_id.setdefault(incident_id, []).append(future)
+        for incident_id, futures in futures_by_id.items():
+            incident = resolved.get(incident_id)
+            error = None
+            if incident is None:
+                error = Exception(
+                    f"[{incident_id}] The incident isn't resolved by "
+                    f"PagerDuty"
+                )
+            else:
+                try:
+                    utils.resolve_incident(incident_id)
+                except Exception as e:
+                    error = e
+            for future in futures:
+                if error is None:
+                    future.set_result(incident)
+                else:
+                    future.set_exception(error)
+
+    @contextlib.contextmanager
+    def batched(self):
+        """
+        Defer the resolution of the incidents submitted by the current
+        thread until the exit of the context and wait for them there.
+        The context is the list of the futures of the submitted
+        incidents, so the caller can tell which of them failed.
+        """
+        futures = getattr(self.local, "futures", None)
+        if futures is not None:
+            yield futures
+            return
+        self.local.futures = []
+        try:
+            yield self.local.futures
+        finally:
+            futures, self.local.futures = self.local.futures, None
+            if futures:
+                self.flush()
+                wait(futures)
+
+
+def get_pagerduty(shard_name):
+    """
+    Return the session of the PagerDuty account of the log entries
+    shard (see `jpi.handlers.shards`), the default account if the
+    incident wasn't created by a shard.
+    """
+    from jpi.handlers import shards
+
+    if shard_name is None or shard_name == shards.DEFAULT_SHARD:
+        return utils.get_pagerduty()
+    return shards.get_shards([shard_name])[0].get_pagerduty()
+
+
+def is_bad_request(error):
+    response = getattr(error, "response", None)
+    return (
+        isinstance(error, PDClientError)
+        and response is not None
+        and response.status_code == 400
+    )
+
+
+resolver = None
+resolver_lock = threading.Lock()
+
+
+def get_resolver():
+    global resolver
+    if resolver is None:
+        with resolver_lock:
+            if resolver is None:
+                resolver = Resolver(
+                    settings.PAGERDUTY_RESOLVE_WINDOW,
+                    settings.PAGERDUTY_RESOLVE_BATCH_SIZE,
+                )
+    return resolver
@@ -3,50 +3,229 @@ import os
 
 PROJECT_PATH = os.path.abspath(os.path.dirname(__name__))
 IS_OFFLINE = os.environ.get("IS_OFFLINE")
-QUESTIONS_FILE = os.environ["QUESTIONS_FILE"]
 
-# Jira settings
+# The required settings are read from the environment on first access
+# (see `__getattr__`), so importing the settings doesn't fail on the
+# code paths that don't need them (e.g. the tools).
+REQUIRED_SETTINGS = (
+    "QUESTIONS_FILE",
+    "JIRA_USER_EMAIL",
+    "JIRA_API_TOKEN",
+    "JIRA_SERVER_URL",
+    "INCIDENT_PROJECT_KEY",
+    "PERSON_PROJECT_KEY",
+    "TIMELINE_PROJECT_KEY",
+    "QUESTION_PROJECT_KEY",
+    "PAGERDUTY_API_TOKEN",
+    "PAGERDUTY_USER_EMAIL",
+)
+
+
+def __getattr__(name):
+    if name in REQUIRED_SETTINGS:
+        value = os.environ[name]
+    elif name == "JIRA_API_URL":
+        value = f"{os.environ['JIRA_SERVER_URL']}/rest/api/3"
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
 
-JIRA_USER_EMAIL = os.environ["JIRA_USER_EMAIL"]
-JIRA_API_TOKEN = os.environ["JIRA_API_TOKEN"]
-JIRA_SERVER_URL = os.environ["JIRA_SERVER_URL"]
-JIRA_API_URL = f"{JIRA_SERVER_URL}/rest/api/3"
+# Jira settings
 
 QUESTION_ISSUE_TYPE_NAME = "Question"
 INCIDENT_MANAGER_ISSUE_TYPE_NAME = "Incident Manager"
 TIMELINE_ISSUE_TYPE_NAME = "Timeline"
 STAKEHOLDER_ISSUE_TYPE_NAME = "Stakeholder"
 
-GLASSWALL_JIRA_PROJECT_KEYS = [
-    "INCIDENT",
-    "PERSON",
-    "TIMELINE",
-    "QUESTION",
-]
+JIRA_ISSUE_STAKEHOLDERS = os.environ.get("JIRA_ISSUE_STAKEHOLDERS", "")
 
-INCIDENT_PROJECT_KEY = os.environ["INCIDENT_PROJECT_KEY"]
-PERSON_PROJECT_KEY = os.environ["PERSON_PROJECT_KEY"]
-TIMELINE_PROJECT_KEY = os.environ["TIMELINE_PROJECT_KEY"]
-QUESTION_PROJECT_KEY = os.environ["QUESTION_PROJECT_KEY"]
+# Jira client settings: the size of the connection pool, the rate limit
+# (requests per second and the size of a burst), the number of retries
+# of a failed request, the maximum backoff between the retries and the
+# timeout of a request (in seconds).
+JIRA_POOL_SIZE = int(os.environ.get("JIRA_POOL_SIZE", 10))
+JIRA_RATE_LIMIT = float(os.environ.get("JIRA_RATE_LIMIT", 10))
+JIRA_RATE_BURST = int(os.environ.get("JIRA_RATE_BURST", 10))
+JIRA_MAX_RETRIES = int(os.environ.get("JIRA_MAX_RETRIES", 3))
+JIRA_MAX_BACKOFF = 30
+JIRA_TIMEOUT = float(os.environ.get("JIRA_TIMEOUT", 10))
 
-JIRA_ISSUE_STAKEHOLDERS = os.environ.get("JIRA_ISSUE_STAKEHOLDERS", "")
+# The maximum number of concurrent Jira requests sent by the asynchronous
+# client (see `jpi.api.jira_async`).
+JIRA_ASYNC_CONCURRENCY = int(os.environ.get("JIRA_ASYNC_CONCURRENCY", 10))
+
+# The maximum number of concurrent calls fanned out by `jpi.fanout`, e.g.
+# the questions and the links of a newly created incident issue.
+FANOUT_CONCURRENCY = int(os.environ.get("FANOUT_CONCURRENCY", 8))
+
+# The maximum number of issues that are created by means of a single
+# `/issue/bulk` request (Jira doesn't accept more than 50).
+JIRA_BULK_CHUNK_SIZE = int(os.environ.get("JIRA_BULK_CHUNK_SIZE", 50))
+
+# The search endpoint (see `jpi.api.jira.iter_search_issues`):
+# `/search/jql` continues a search by `nextPageToken`, the pages of the
+# legacy `/search` endpoint are requested concurrently, up to
+# `JIRA_SEARCH_CONCURRENCY` at a time.
+JIRA_SEARCH_ENDPOINT = os.environ.get("JIRA_SEARCH_ENDPOINT", "/search/jql")
+JIRA_SEARCH_PAGE_SIZE = int(os.environ.get("JIRA_SEARCH_PAGE_SIZE", 100))
+JIRA_SEARCH_CONCURRENCY = int(os.environ.get("JIRA_SEARCH_CONCURRENCY", 4))
+
+# The person directory (see `jpi.persons`) is reloaded from Jira
+# completely once per `PERSON_DIRECTORY_TTL_HOURS` and is refreshed
+# incrementally on every polling of the log entries in between. A
+# person that isn't found refreshes it at most once per
+# `PERSON_DIRECTORY_RELOAD_INTERVAL` seconds.
+PERSON_DIRECTORY_TTL_HOURS = int(
+    os.environ.get("PERSON_DIRECTORY_TTL_HOURS", 24)
+)
+PERSON_DIRECTORY_READ_INTERVAL = 300
+PERSON_DIRECTORY_RELOAD_INTERVAL = 60
+PERSON_DIRECTORY_PAGE_SIZE = 100
+
+# The metadata of Jira (the fields, the issue types, the types of link
+# and "Done" transitions, see `jpi.metadata`) is cached in the config
+# table and is loaded from Jira again once per `JIRA_METADATA_TTL_HOURS`.
+JIRA_METADATA_TTL_HOURS = int(os.environ.get("JIRA_METADATA_TTL_HOURS", 24))
+# A field, an issue type or a type of link missing in the cache reloads
+# the metadata at most once per `JIRA_METADATA_RELOAD_INTERVAL` seconds.
+JIRA_METADATA_RELOAD_INTERVAL = 60
 
 JIRA_SEVERITY_FIELD_NAME = "Severity"
 JIRA_INCIDENT_SEVERITY = "SEV-0"
 
 # PagerDuty settings
 
-PAGERDUTY_API_TOKEN = os.environ["PAGERDUTY_API_TOKEN"]
 PAGERDUTY_USER_NAME = os.environ.get("PAGERDUTY_USER_NAME", "")
-PAGERDUTY_USER_EMAIL = os.environ["PAGERDUTY_USER_EMAIL"]
+
+# The maximum number of concurrent PagerDuty requests sent by the
+# asynchronous client (see `jpi.api.pagerduty_async`).
+PAGERDUTY_ASYNC_CONCURRENCY = int(
+    os.environ.get("PAGERDUTY_ASYNC_CONCURRENCY", 4)
+)
 
 LOG_ENTRIES_ENDPOINT = "/log_entries"
 INCIDENT_ENDPOINT = "incidents"
+
+# The incidents resolved from Jira are resolved in bulk (see
+# `jpi.resolver`): the incidents resolved within
+# `PAGERDUTY_RESOLVE_WINDOW` seconds (immediately if `0`) are resolved
+# by means of a single request, up to `PAGERDUTY_RESOLVE_BATCH_SIZE`
+# incidents per request (PagerDuty doesn't accept more than 250).
+PAGERDUTY_RESOLVE_WINDOW = float(
+    os.environ.get("PAGERDUTY_RESOLVE_WINDOW", 0.2)
+)
+PAGERDUTY_RESOLVE_BATCH_SIZE = int(
+    os.environ.get("PAGERDUTY_RESOLVE_BATCH_SIZE", 100)
+)
+
 STATUS_RESOLVED = "resolved"
 LOG_ENTRIES_POLL_PAST_HOURS = int(
     os.environ.get("LOG_ENTRIES_POLL_PAST_HOURS", 1)
 )
+# The types of the log entries mirrored to the timeline of the Jira issue
+# of an incident, all types if empty, e.g.
+# "annotate_log_entry,acknowledge_log_entry,priority_change_log_entry".
+LOG_ENTRIES_MIRROR_TYPES = [
+    t for t in os.environ.get("LOG_ENTRIES_MIRROR_TYPES", "").split(",") if t
+]
+# Request only the most important log entries (`is_overview`) and the
+# related objects to include to the log entries (`include[]`) from
+# PagerDuty.
+LOG_ENTRIES_IS_OVERVIEW = os.environ.get(
+    "LOG_ENTRIES_IS_OVERVIEW", ""
+).lower() in ("1", "true", "yes")
+LOG_ENTRIES_INCLUDE = [
+    i for i in os.environ.get("LOG_ENTRIES_INCLUDE", "").split(",") if i
+]
+# Every polling re-reads the log entries created within the given number
+# of minutes before the latest processed one, so the entries that appear
+# in PagerDuty with a delay are not missed (the processed ones are
+# skipped).
+LOG_ENTRIES_OVERLAP_MINUTES = int(
+    os.environ.get("LOG_ENTRIES_OVERLAP_MINUTES", 10)
+)
+# A log entry that fails to be processed is retried by the next pollings
+# until it is older than the given number of hours, then it is given up
+# (and logged), so the polling moves past it.
+LOG_ENTRIES_RETRY_HOURS = int(os.environ.get("LOG_ENTRIES_RETRY_HOURS", 6))
+# The number of log entries requested per page (PagerDuty doesn't
+# allow more than 100).
+LOG_ENTRIES_PAGE_SIZE = int(os.environ.get("LOG_ENTRIES_PAGE_SIZE", 100))
 P1_PRIORITY_NAME = "P1"
+# The number of workers processing log entries in parallel. The entries
+# of the same incident are always processed by a single worker in order.
+LOG_ENTRIES_WORKERS = int(os.environ.get("LOG_ENTRIES_WORKERS", 1))
+# The log entries are polled by shards (see `jpi.handlers.shards`)
+# defined in `LOG_ENTRIES_SHARDS_FILE`, a single shard of the default
+# account if it isn't set. Up to `LOG_ENTRIES_SHARD_WORKERS` shards are
+# polled in parallel.
+LOG_ENTRIES_SHARDS_FILE = os.environ.get("LOG_ENTRIES_SHARDS_FILE", "")
+LOG_ENTRIES_SHARD_WORKERS = int(
+    os.environ.get("LOG_ENTRIES_SHARD_WORKERS", 4)
+)
+
+# The ids of the processed log entries are kept per shard and hour the
+# entries were created within for the given number of hours. The older
+# log entries are considered processed, so the number should be greater
+# than `LOG_ENTRIES_POLL_PAST_HOURS` and the polling interval.
+LOG_ENTRIES_DEDUP_RETENTION_HOURS = int(
+    os.environ.get("LOG_ENTRIES_DEDUP_RETENTION_HOURS", 48)
+)
+# The ids of an hour are spread over the given number of items by a
+# hash of the id, since an item holds up to 400KB (about 13000 ids). It
+# should be increased if a shard gets more log entries per hour.
+LOG_ENTRIES_BUCKET_PARTITIONS = int(
+    os.environ.get("LOG_ENTRIES_BUCKET_PARTITIONS", 4)
+)
+# The log entries that aren't found in the buckets are looked up among
+# the items of the log entries processed before the buckets were
+# introduced (an item per log entry). It should be enabled only while
+# migrating, until these items expire (see `log-entries-expiration`
+# migration in `README.md`).
+LOG_ENTRIES_READ_LEGACY_ITEMS = os.environ.get(
+    "LOG_ENTRIES_READ_LEGACY_ITEMS", "false"
+).lower() in ("1", "true", "yes")
+
+# Webhook queue settings. If `WEBHOOK_QUEUE_BACKEND` is set, the
+# webhooks are put to a queue and are handled in background: `sqs` is
+# an Amazon SQS queue (`WEBHOOK_QUEUE_URL`), `sqlite` is a local
+# stand-in that keeps the messages in `WEBHOOK_QUEUE_SQLITE_PATH`.
+
+WEBHOOK_QUEUE_BACKEND = os.environ.get("WEBHOOK_QUEUE_BACKEND", "")
+WEBHOOK_QUEUE_URL = os.environ.get("WEBHOOK_QUEUE_URL", "")
+WEBHOOK_QUEUE_SQLITE_PATH = os.environ.get(
+    "WEBHOOK_QUEUE_SQLITE_PATH", ".webhook-queue.sqlite3"
+)
+WEBHOOK_QUEUE_VISIBILITY_TIMEOUT = 300
+WEBHOOK_QUEUE_MAX_ATTEMPTS = 5
+WEBHOOK_QUEUE_POLL_INTERVAL = 5
+
+# Webhook deduplication settings: the number of the recent events kept
+# in memory and the number of hours the events are kept in the database.
+
+DEDUP_CACHE_SIZE = 1024
+DEDUP_TTL_HOURS = int(os.environ.get("DEDUP_TTL_HOURS", 48))
+
+# Metrics settings: the calls of Jira, PagerDuty and DynamoDB are
+# written to the log as CloudWatch embedded metric format lines if
+# `METRICS_EMF` is enabled (on AWS Lambda by default) and are exposed
+# in Prometheus format by `/metrics` route if `METRICS_ROUTE` is
+# enabled (`1`, `true` or `yes`).
+
+METRICS_EMF = os.environ.get(
+    "METRICS_EMF",
+    "true" if os.environ.get("AWS_LAMBDA_FUNCTION_NAME") else "",
+).lower() in ("1", "true", "yes")
+METRICS_ROUTE = os.environ.get("METRICS_ROUTE", "").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+METRICS_NAMESPACE = os.environ.get(
+    "METRICS_NAMESPACE", "JiraPagerDutyIntegration"
+)
 
 # Logging settings
 
@@ -57,14 +236,44 @@ LOGGING_FORMAT = "%(asctime)s %(name)-12s %(levelname)-8s %(message)s"
 DATABASE_ENDPOINT_URL = "http://localhost:8002"
 
 INCIDENTS_TABLE = os.environ.get("INCIDENTS_TABLE", "incidents-dev")
+# A global secondary index of the incidents table by `issueKey`.
+INCIDENTS_ISSUE_KEY_INDEX = os.environ.get(
+    "INCIDENTS_ISSUE_KEY_INDEX", "issueKey-index"
+)
 LOG_ENTRIES_TABLE = os.environ.get("LOG_ENTRIES_TABLE", "log-entries-dev")
 CONFIG_TABLE = os.environ.get("CONFIG_TABLE", "config-dev")
+EVENTS_TABLE = os.environ.get("EVENTS_TABLE", "events-dev")
+
+# The maximum number of keys requested by means of a single
+# `BatchGetItem` request (DynamoDB doesn't accept more than 100).
+DATABASE_BATCH_GET_SIZE = 100
 
 CONFIG_PARAMETER_FIELD_NAME = "parameterName"
 CONFIG_VALUE_FIELD_NAME = "value"
 ISSUE_KEY_FIELD_NAME = "issueKey"
 INCIDENT_ID_FIELD_NAME = "incidentId"
 LOG_ENTRY_ID_FIELD_NAME = "logEntryId"
+LOG_ENTRY_IDS_FIELD_NAME = "logEntryIds"
+LOG_ENTRIES_BUCKET_PREFIX = "bucket#"
 LAST_POLLING_TIMESTAMP_PARAM = "LastPollingTimestamp"
+POLLING_CURSOR_PARAM = "LogEntriesPollingCursor"
+PERSON_DIRECTORY_PARAM = "PersonDirectory"
+JIRA_METADATA_PARAM = "JiraMetadata"
 RESOLVED_FIELD_NAME = "resolved"
 INCIDENT_NUMBER_FIELD_NAME = "incident_number"
+EVENT_ID_FIELD_NAME = "eventId"
+EXPIRES_AT_FIELD_NAME = "expiresAt"
+# The log entries shard the incident was created by, so it is resolved
+# in the PagerDuty account of the shard.
+SHARD_FIELD_NAME = "shard"
+# The attributes of an incident that are read from the database.
+INCIDENT_ATTRIBUTES = (
+    INCIDENT_ID_FIELD_NAME,
+    ISSUE_KEY_FIELD_NAME,
+    RESOLVED_FIELD_NAME,
+    INCIDENT_NUMBER_FIELD_NAME,
+    SHARD_FIELD_NAME,
+    "priority",
+    "created",
+    "updated",
+)
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+import argparse
+import logging
+import sys
+import time
+
+from jpi import db, settings
+
+
+logging.basicConfig(
+    stream=sys.stdout, level=logging.INFO, format=settings.LOGGING_FORMAT
+)
+logger = logging.getLogger()
+
+WAIT_INTERVAL = 10
+
+
+def get_index(table, index_name):
+    table.reload()
+    for index in table.global_secondary_indexes or []:
+        if index["IndexName"] == index_name:
+            return index
+
+
+def count_items_with_issue_key(table):
+    """
+    Count the incidents that have `issueKey` attribute, i.e. the items
+    that have to be present in the index.
+    """
+    count = 0
+    kwargs = {
+        "Select": "COUNT",
+        "FilterExpression": "attribute_exists(#issueKey)",
+        "ExpressionAttributeNames": {
+            "#issueKey": settings.ISSUE_KEY_FIELD_NAME
+        },
+    }
+    while True:
+        response = table.scan(**kwargs)
+        count += response["Count"]
+        if "LastEvaluatedKey" not in response:
+            return count
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def migrate_issue_key_index():
+    """
+    Create the global secondary index by `issueKey` on an existing
+    incidents table (the tables created by means of `serverless.yml`
+    already have it) and wait until DynamoDB backfills it with the
+    existing items.
+    """
+    table = db.get_resource().Table(settings.INCIDENTS_TABLE)
+    index_name = settings.INCIDENTS_ISSUE_KEY_INDEX
+    if get_index(table, index_name):
+        logger.info(f'Index "{index_name}" already exists')
+    else:
+        table.update(
+            AttributeDefinitions=[{
+                "AttributeName": settings.ISSUE_KEY_FIELD_NAME,
+                "AttributeType": "S",
+            }],
+            GlobalSecondaryIndexUpdates=[{
+                "Create": {
+                    "IndexName": index_name,
+                    "KeySchema": [{
+                        "AttributeName": settings.ISSUE_KEY_FIELD_NAME,
+                        "KeyType": "HASH",
+                    }],
+                    "Projection": {"ProjectionType": "KEYS_ONLY"},
+                    "ProvisionedThroughput": {
+                        "ReadCapacityUnits": 1,
+                        "WriteCapacityUnits": 1,
+                    },
+                },
+            }],
+        )
+        logger.info(f'Index "{index_name}" is being created')
+
+    while True:
+        index = get_index(table, index_name)
+        if index is None:
+            # The table description doesn't list the index for a while
+            # after `UpdateTable`.
+            status = "CREATING"
+        elif index["IndexStatus"] == "ACTIVE" and not index.get(
+            "Backfilling"
+        ):
+            break
+        else:
+            status = index["IndexStatus"]
+        logger.info(f'Index "{index_name}" is {status}. Waiting...')
+        time.sleep(WAIT_INTERVAL)
+
+    count = count_items_with_issue_key(table)
+    logger.info(f'Index "{index_name}" is active, {count} incidents indexed')
+
+
+def enable_time_to_live(table_name):
+    client = db.get_resource().meta.client
+    response = client.describe_time_to_live(TableName=table_name)
+    description = response["TimeToLiveDescription"]
+    if description["TimeToLiveStatus"] in ("ENABLED", "ENABLING"):
+        logger.info(f'Time to live of "{table_name}" is already enabled')
+        return
+    client.update_time_to_live(
+        TableName=table_name,
+        TimeToLiveSpecification={
+            "Enabled": True,
+            "AttributeName": settings.EXPIRES_AT_FIELD_NAME,
+        },
+    )
+    logger.info(f'Time to live of "{table_name}" is enabled')
+
+
+def migrate_log_entries_expiration():
+    """
+    Enable the time to live of the log entries table and make the rows
+    of the log entries processed before the buckets were introduced
+    (an item per log entry) expire in
+    `LOG_ENTRIES_DEDUP_RETENTION_HOURS`.
+    """
+    table = db.get_resource().Table(settings.LOG_ENTRIES_TABLE)
+    enable_time_to_live(settings.LOG_ENTRIES_TABLE)
+    expires_at = int(
+        time.time() + settings.LOG_ENTRIES_DEDUP_RETENTION_HOURS * 3600
+    )
+    log_entry_key = settings.LOG_ENTRY_ID_FIELD_NAME
+    kwargs = {
+        "FilterExpression": (
+            "attribute_not_exists(#expiresAt) "
+            "AND NOT begins_with(#logEntryId, :prefix)"
+        ),
+        "ExpressionAttributeNames": {
+            "#expiresAt": settings.EXPIRES_AT_FIELD_NAME,
+            "#logEntryId": log_entry_key,
+        },
+        "ExpressionAttributeValues": {
+            ":prefix": settings.LOG_ENTRIES_BUCKET_PREFIX,
+        },
+    }
+    count = 0
+    with table.batch_writer() as batch:
+        while True:
+            response = table.scan(**kwargs)
+            for item in response["Items"]:
+                batch.put_item(Item={
+                    **item,
+                    settings.EXPIRES_AT_FIELD_NAME: expires_at,
+                })
+            count += len(response["Items"])
+            if "LastEvaluatedKey" not in response:
+                break
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    logger.info(f"{count} log entries will expire")
+
+
+MIGRATIONS = {
+    "issue-key-index": migrate_issue_key_index,
+    "log-entries-expiration": migrate_log_entries_expiration,
+}
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Database migration tool.")
+    parser.add_argument("migration", choices=sorted(MIGRATIONS))
+
+    args = parser.parse_args()
+
+    MIGRATIONS[args.migration]()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+import argparse
+import logging
+import statistics
+import subprocess
+import sys
+
+from jpi import settings
+
+
+logging.basicConfig(
+    stream=sys.stdout, level=logging.INFO, format=settings.LOGGING_FORMAT
+)
+logger = logging.getLogger()
+
+# The modules imported by the functions (see `serverless.yml`) and the
+# dependencies that they should import on first use only.
+TARGETS = {
+    "jpi.handlers": ["boto3", "botocore", "flask"],
+    "jpi.app": ["boto3", "botocore", "pdpyras"],
+}
+
+
+def measure(module):
+    """
+    Import the module in a fresh interpreter and return a dict that
+    maps the imported modules to their cumulative import time in
+    microseconds (see `python -X importtime`).
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    if result.returncode:
+        raise Exception(f"Error importing {module}:\n{result.stderr}")
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        try:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            times[name.strip()] = int(cumulative)
+        except ValueError:
+            # The header of the output.
+            continue
+    return times
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Measure the import time of the functions."
+    )
+    parser.add_argument("modules", nargs="*", default=list(TARGETS))
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="Number of measurements, the median is reported",
+    )
+    parser.add_argument(
+        "--top", type=int, default=10, help="Number of the slowest imports"
+    )
+    parser.add_argument(
+        "--max-ms",
+        type=float,
+        help="Exit with an error if an import takes longer",
+    )
+
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        runs = [measure(module) for _ in range(args.repeat)]
+        total = statistics.median(run[module] for run in runs) / 1000
+        logger.info(f"{module}: {total:.1f} ms")
+        slowest = sorted(
+            (
+                (statistics.median(run.get(name, 0) for run in runs), name)
+                for name in runs[-1]
+                if name != module
+            ),
+            reverse=True,
+        )
+        for microseconds, name in slowest[:args.top]:
+            logger.info(f"    {name}: {microseconds / 1000:.1f} ms")
+        deferred = [m for m in TARGETS.get(module, []) if m in runs[-1]]
+        if deferred:
+            logger.warning(
+                f"{module} imports {', '.join(deferred)} at import time"
+            )
+        if args.max_ms is not None and total > args.max_ms:
+            logger.error(f"{module} takes longer than {args.max_ms} ms")
+            failed = True
+
+    sys.exit(1 if failed else 0)
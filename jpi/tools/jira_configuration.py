@@ -1,11 +1,14 @@
 import argparse
+import json
 import logging
+import os
+import string
 import sys
 
 from faker import Faker
 from requests.exceptions import HTTPError
 
-from jpi import settings
+from jpi import fanout, metadata, persons, settings
 from jpi.api import jira
 
 
@@ -14,168 +17,338 @@ logging.basicConfig(
 )
 [
     logging.getLogger(p).setLevel(logging.ERROR)
-    for p in ["faker.factory", "urllib3"]
+    for p in ["faker.factory", "urllib3", "botocore"]
 ]
 logger = logging.getLogger()
 fake = Faker()
 
+# The desired state of Jira: the projects (every project has an issue
+# type named after its key), the types of link and the persons. The
+# `${NAME}` placeholders are replaced with the settings (see
+# `load_desired_state`).
+DESIRED_STATE_FILE = "etc/jira_configuration.json"
 
-def create_issue_type(name, description="", issue_type_type="standard"):
-    issue_type = None
-    try:
-        issue_type = jira.create_issue_type(name, description, issue_type_type)
-        logger.info(f'Issue type "{name}" successfully created')
-    except HTTPError as error:
-        if error.response.status_code == 409:
-            logger.info(f'Issue type "{name}" already exists. Skipping...')
-        else:
-            logger.exception("Error occurred while creating an issue")
-    return issue_type
+
+class Settings:
+    """
+    A mapping of the settings for `string.Template`.
+    """
+
+    def __getitem__(self, name):
+        try:
+            return str(getattr(settings, name))
+        except AttributeError:
+            raise KeyError(name)
 
 
-def create_project(key, name):
+class Change:
     """
-    This method (as you can see) is implemented by means of `requests`
-    but not `jira` library. I wasn't able to work around "You must
-    specify a valid project lead" error while creating a project.
+    A missing object: `description` is shown by the plan and `func` is
+    called with `args` in order to create it. The changes of `step` 1
+    (the projects and the issue types) are applied before the rest.
     """
-    project = None
-    try:
-        project = jira.get_project(key)
-    except HTTPError as error:
-        if error.response.status_code == 404:
-            pass
+
+    def __init__(self, step, description, func, *args):
+        self.step = step
+        self.description = description
+        self.func = func
+        self.args = args
+
+
+def substitute(value):
+    """
+    Replace the `${NAME}` placeholders of the strings of `value` with
+    the settings.
+    """
+    if isinstance(value, dict):
+        return {key: substitute(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [substitute(item) for item in value]
+    if isinstance(value, str):
+        return string.Template(value).substitute(Settings())
+    return value
+
+
+def resolve(items, strict):
+    """
+    Return the items with the placeholders replaced. An item that
+    refers to a missing setting (or a person without a name) raises an
+    exception if `strict`, otherwise it is skipped with a warning, e.g.
+    while planning.
+    """
+    resolved = []
+    for item in items:
+        try:
+            item = substitute(item)
+        except KeyError as error:
+            message = f"The setting {error} of {item!r} is not set"
         else:
-            raise
+            if item:
+                resolved.append(item)
+                continue
+            message = (
+                "A person without a name, check the settings (e.g. "
+                "`PAGERDUTY_USER_NAME`)"
+            )
+        if strict:
+            raise Exception(message)
+        logger.warning(f"{message}. Skipping...")
+    return resolved
 
-    if project:
-        logger.info(f'Project "{name}" already exists. Skipping...')
-        return project
 
-    jira.create_project(key, name)
-    logger.info(f'Project "{name}" successfully created')
+def load_desired_state(path, step=None, strict=True):
+    """
+    Load the desired state and replace its placeholders. Only the
+    objects the step touches are resolved (the projects for step 1,
+    everything otherwise), so e.g. step 1 doesn't need the settings of
+    the persons. See `resolve` for `strict`.
+    """
+    with open(os.path.join(settings.PROJECT_PATH, path)) as f:
+        state = json.load(f)
+    desired = {"projects": resolve(state.get("projects", []), strict)}
+    if step != 1:
+        desired["linkTypes"] = resolve(state.get("linkTypes", []), strict)
+        desired["persons"] = resolve(state.get("persons", []), strict)
+    return desired
 
-    return jira.get_project(key)
 
+def get_issue_type_name(project_key):
+    return project_key.title()
 
-def create_issue(project_key, summary):
-    issue_dict = {
-        "project": {"key": project_key},
-        "summary": summary,
-        "issuetype": {"name": project_key.title()},
+
+def read_current_state(desired):
+    """
+    Read the current state of Jira: the requests are sent concurrently,
+    one per kind of objects (the persons are searched page by page).
+    Then the projects that have to contain sample issues are checked
+    for emptiness concurrently.
+    """
+    result = fanout.fan_out([
+        ("myself", jira.myself, ()),
+        ("projects", jira.get_projects, ()),
+        ("issueTypes", jira.get_issue_types, ()),
+        ("linkTypes", jira.get_issue_link_types, ()),
+        ("persons", get_person_names, ()),
+    ])
+    if result.errors:
+        raise next(iter(result.errors.values()))
+    state = {
+        "accountId": result.results["myself"]["accountId"],
+        "projects": {p["key"] for p in result.results["projects"]},
+        "issueTypes": {t["name"] for t in result.results["issueTypes"]},
+        "linkTypes": {t["name"] for t in result.results["linkTypes"]},
+        "persons": result.results["persons"],
     }
-    try:
-        issue = jira.create_issue(fields=issue_dict)
-        issue_key = issue['key']
-        logger.info(f'Issue "{issue_key}" successfully created')
-    except HTTPError:
-        logger.exception("Error occurred while creating an issue")
-
-
-def create_issue_link_type(issue_link_type, outward, inward):
-    for link_type in jira.get_issue_link_types():
-        if link_type['name'] == issue_link_type:
-            msg = (
-                f'Issue link type "{issue_link_type}" '
-                f"already exists. Skipping..."
-            )
-            logger.info(msg)
-            break
-    else:
-        jira.create_issue_link_type(issue_link_type, outward, inward)
-        logger.info(f'Issue link type "{issue_link_type}" created')
-
-
-def step1():
-    for project_key in settings.GLASSWALL_JIRA_PROJECT_KEYS:
-        issue_type_key = project_key.title()
-        create_project(project_key, f'{issue_type_key}s')
-        create_issue_type(
-            issue_type_key,
-            description=f"Corresponding to Glasswall {issue_type_key}"
-        )
+    project_keys = [
+        p["key"] for p in desired.get("projects", [])
+        if p.get("sampleIssues") and p["key"] in state["projects"]
+    ]
+    result = fanout.fan_out([
+        (key, is_empty_project, (key,)) for key in project_keys
+    ])
+    if result.errors:
+        raise next(iter(result.errors.values()))
+    state["emptyProjects"] = {
+        key for key, is_empty in result.results.items() if is_empty
+    }
+    return state
 
 
-def step2():
-    project = create_project(settings.PERSON_PROJECT_KEY, "Persons")
-    if project:
-        create_issue(settings.PERSON_PROJECT_KEY, fake.name())
-        create_issue(settings.PERSON_PROJECT_KEY, fake.name())
-        create_issue(settings.PERSON_PROJECT_KEY, fake.name())
-
-    project = create_project(settings.INCIDENT_PROJECT_KEY, "Incidents")
-    if project:
-        create_issue(settings.INCIDENT_PROJECT_KEY, fake.sentence())
-        create_issue(settings.INCIDENT_PROJECT_KEY, fake.sentence())
-        create_issue(settings.INCIDENT_PROJECT_KEY, fake.sentence())
-
-    project = create_project(settings.QUESTION_PROJECT_KEY, "Questions")
-    if project:
-        create_issue(settings.QUESTION_PROJECT_KEY, fake.sentence())
-        create_issue(settings.QUESTION_PROJECT_KEY, fake.sentence())
-        create_issue(settings.QUESTION_PROJECT_KEY, fake.sentence())
-
-    project = create_project(settings.TIMELINE_PROJECT_KEY, "Timeline")
-    if project:
-        create_issue(settings.TIMELINE_PROJECT_KEY, fake.sentence())
-        create_issue(settings.TIMELINE_PROJECT_KEY, fake.sentence())
-        create_issue(settings.TIMELINE_PROJECT_KEY, fake.sentence())
-
-    create_issue_link_type(
-        settings.QUESTION_ISSUE_TYPE_NAME, "has question", "is question of")
-    create_issue_link_type(
-        settings.INCIDENT_MANAGER_ISSUE_TYPE_NAME,
-        "has incident manager",
-        "is incident manager of"
-    )
+def is_missing_project(error):
+    return error.response.status_code in (400, 404)
+
 
-    if not settings.PAGERDUTY_USER_NAME:
-        msg = (
-            "`PAGERDUTY_USER_NAME` setting is not defined. "
-            "It should be provided via an environment variable."
+def get_person_names():
+    """
+    Return the normalized names of the persons. They are searched in
+    Jira directly, the tool doesn't write the person directory (see
+    `jpi.persons`) of the deployed integration.
+    """
+    try:
+        issues = jira.iter_search_issues(
+            f"project={settings.PERSON_PROJECT_KEY}", fields=["summary"]
         )
-        raise Exception(msg)
-    query = 'project={} and summary~"{}"'.format(
-        settings.PERSON_PROJECT_KEY, settings.PAGERDUTY_USER_NAME
-    )
-    persons = jira.search_issues(query)
-    if persons['issues']:
-        msg = 'Person "{}" already exists. Skipping...'
-        logger.info(msg.format(settings.PAGERDUTY_USER_NAME))
-    else:
-        fields = {
-            "project": {"key": settings.PERSON_PROJECT_KEY},
-            "summary": settings.PAGERDUTY_USER_NAME,
-            "issuetype": {"name": settings.PERSON_PROJECT_KEY.title()},
+        return {
+            persons.normalize(issue["fields"]["summary"] or "")
+            for issue in issues
         }
-        jira.create_issue(fields)
-        logger.info(
-            f'Person "{settings.PAGERDUTY_USER_NAME}" successfully created'
+    except HTTPError as error:
+        if is_missing_project(error):
+            # The project doesn't exist yet.
+            return set()
+        raise
+
+
+def is_empty_project(project_key):
+    issues = jira.iter_search_issues(f"project={project_key}", page_size=1)
+    return next(issues, None) is None
+
+
+def plan(desired, current):
+    """
+    Return the list of the changes that turn the current state of Jira
+    into the desired one.
+    """
+    changes = []
+    for project in desired.get("projects", []):
+        key = project["key"]
+        issue_type = get_issue_type_name(key)
+        if issue_type not in current["issueTypes"]:
+            changes.append(Change(
+                1,
+                f'issue type "{issue_type}"',
+                create_issue_type,
+                issue_type,
+                f"Corresponding to Glasswall {issue_type}",
+            ))
+        if key not in current["projects"]:
+            changes.append(Change(
+                1,
+                f'project {key} "{project["name"]}"',
+                create_project,
+                key,
+                project["name"],
+                current["accountId"],
+            ))
+        is_new = (
+            key not in current["projects"] or key in current["emptyProjects"]
         )
+        if project.get("sampleIssues") and is_new:
+            for _ in range(project["sampleIssues"]):
+                if key == settings.PERSON_PROJECT_KEY:
+                    summary = fake.name()
+                else:
+                    summary = fake.sentence()
+                changes.append(Change(
+                    2,
+                    f'sample issue of {key} "{summary}"',
+                    create_issue,
+                    key,
+                    summary,
+                ))
+    for link_type in desired.get("linkTypes", []):
+        if link_type["name"] not in current["linkTypes"]:
+            changes.append(Change(
+                2,
+                f'link type "{link_type["name"]}"',
+                jira.create_issue_link_type,
+                link_type["name"],
+                link_type["outward"],
+                link_type["inward"],
+            ))
+    for name in desired.get("persons", []):
+        if persons.normalize(name) not in current["persons"]:
+            changes.append(Change(
+                2,
+                f'person "{name}"',
+                create_issue,
+                settings.PERSON_PROJECT_KEY,
+                name,
+            ))
+    return changes
 
-    create_issue_link_type(
-        settings.TIMELINE_ISSUE_TYPE_NAME,
-        "has timeline",
-        "is timeline of"
-    )
 
-    create_issue_link_type(
-        settings.STAKEHOLDER_ISSUE_TYPE_NAME,
-        "has stakeholder",
-        "is stakeholder of"
-    )
+def create_issue_type(name, description):
+    try:
+        jira.create_issue_type(name, description)
+    except HTTPError as error:
+        if error.response.status_code != 409:
+            raise
+        logger.info(f'Issue type "{name}" already exists. Skipping...')
+
+
+def create_project(key, name, lead_account_id):
+    try:
+        jira.create_project(key, name, lead_account_id)
+    except Exception as error:
+        # The project might have been created in the meantime.
+        try:
+            jira.get_project(key)
+        except HTTPError:
+            raise error
+        logger.info(f'Project "{name}" already exists. Skipping...')
+
+
+def create_issue(project_key, summary):
+    jira.create_issue({
+        "project": {"key": project_key},
+        "summary": summary,
+        "issuetype": {"name": get_issue_type_name(project_key)},
+    })
+
+
+def apply(changes):
+    """
+    Apply the changes step by step, the changes of a step are applied
+    concurrently. Return `True` if all the changes are applied.
+    """
+    ok = True
+    for step in sorted({change.step for change in changes}):
+        result = fanout.fan_out([
+            (change.description, change.func, change.args)
+            for change in changes
+            if change.step == step
+        ])
+        for description in result.results:
+            logger.info(f"Created {description}")
+        for description, error in result.errors.items():
+            logger.error(
+                f"Error occurred while creating {description}: {error!r}"
+            )
+        ok = ok and result.ok
+    return ok
 
 
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description='Jira configuration tool.')
-    parser.add_argument('-s', '--step', dest='step', type=int, required=True)
+    parser.add_argument(
+        '-s',
+        '--step',
+        dest='step',
+        type=int,
+        choices=[1, 2],
+        help='Apply the projects and the issue types only (1) or all (2), '
+        'required unless --plan is given',
+    )
+    parser.add_argument(
+        '--plan',
+        action='store_true',
+        help='Show the changes without applying them',
+    )
+    parser.add_argument(
+        '--state-file',
+        default=DESIRED_STATE_FILE,
+        help='The desired state of Jira',
+    )
 
     args = parser.parse_args()
+    if args.step is None and not args.plan:
+        # The issue type schemes are edited manually between the steps
+        # (see `JIRA_CONFIGURATION.md`).
+        parser.error("--step is required unless --plan is given")
 
+    desired = load_desired_state(
+        args.state_file, args.step, strict=not args.plan
+    )
+    changes = plan(desired, read_current_state(desired))
     if args.step == 1:
-        step1()
-    elif args.step == 2:
-        step2()
-    else:
-        raise Exception('Invalid step number. Allowed values: 1 and 2')
+        changes = [change for change in changes if change.step == 1]
+
+    if not changes:
+        logger.info("Jira is up to date")
+        sys.exit(0)
+    for change in changes:
+        logger.info(f"+ {change.description}")
+    if args.plan:
+        sys.exit(0)
+
+    ok = apply(changes)
+
+    # The cached metadata of Jira is stale now (see `jpi.metadata`).
+    try:
+        metadata.invalidate_all()
+    except Exception:
+        logger.exception("Error occurred while invalidating Jira metadata")
+
+    sys.exit(0 if ok else 1)
@@ -3,28 +3,42 @@ import logging
 import os
 from requests.exceptions import HTTPError
 
-from pdpyras import APISession
-
-from jpi import settings, db
-from jpi.api import jira
+from jpi import settings, db, fanout, metadata, metrics, persons
+from jpi.api import jira, jira_async
 
 
 pagerduty = None
+# The sessions of the other PagerDuty accounts by their API tokens.
+pagerduty_sessions = {}
 questions = None
-severity_field_id = None
 logger = logging.getLogger()
 
 
-def get_pagerduty():
+def get_pagerduty(api_token=None):
+    """
+    Return the session of the PagerDuty account with the given API
+    token, the default account (`PAGERDUTY_API_TOKEN`) if it is `None`.
+    """
     global pagerduty
+    if api_token is not None:
+        if api_token not in pagerduty_sessions:
+            pagerduty_sessions[api_token] = create_pagerduty(api_token)
+        return pagerduty_sessions[api_token]
     if pagerduty is None:
-        pagerduty = APISession(
-            settings.PAGERDUTY_API_TOKEN,
-            default_from=settings.PAGERDUTY_USER_EMAIL,
-        )
+        pagerduty = create_pagerduty(settings.PAGERDUTY_API_TOKEN)
     return pagerduty
 
 
+def create_pagerduty(api_token):
+    from pdpyras import APISession
+
+    session = APISession(
+        api_token, default_from=settings.PAGERDUTY_USER_EMAIL
+    )
+    metrics.instrument_session(session, "pagerduty")
+    return session
+
+
 def get_questions():
     global questions
     if questions is None:
@@ -50,46 +64,90 @@ def link_issue(outward, inward, link_type):
     of link to create. `inward` and `outward` are the keys of the
     issues that are being linked.
     """
+    if not check_link_type(link_type):
+        return
     try:
         jira.create_issue_link(link_type, inward, outward)
         logger.info(f'Issue link type "{link_type}" successfully created')
-    except HTTPError:
+    except HTTPError as error:
         logger.exception(
             f'Error occurred during creating a link between "{outward}" '
             f'and "{inward}" issues using the type of link "{link_type}"'
         )
+        handle_link_error(error)
+
+
+def check_link_type(link_type):
+    """
+    Return `False` and log an error if there is no such type of link in
+    Jira (see `jpi.metadata`), so the link isn't requested in vain.
+    """
+    if metadata.has_link_type(link_type):
+        return True
+    logger.error(
+        f'Issue link type "{link_type}" does not exist. Run the Jira '
+        f'configuration tool (see `README.md`) in order to create it'
+    )
+    return False
+
+
+def check_issue_type(issue_type):
+    """
+    Return `False` and log an error if there is no such issue type in
+    Jira (see `jpi.metadata`), so the issues aren't requested in vain.
+    """
+    if metadata.has_issue_type(issue_type["name"]):
+        return True
+    logger.error(
+        f'Issue type "{issue_type["name"]}" does not exist. Run the Jira '
+        f'configuration tool (see `README.md`) in order to create it'
+    )
+    return False
+
+
+def handle_link_error(error):
+    """
+    Invalidate the cached types of link if Jira responds with 404: the
+    type of link may have been renamed or removed.
+    """
+    if error.response is not None and error.response.status_code == 404:
+        metadata.invalidate(metadata.LINK_TYPES)
 
 
 def get_jira_severity_field_id():
     """
-    Return `id` of a field which name equals to `Severity`.
+    Return `id` of a field which name equals to `Severity`. The fields
+    are cached (see `jpi.metadata`).
     """
-    global severity_field_id
-    if severity_field_id:
-        return severity_field_id
-    severity_fields = [
-        f for f in jira.get_fields()
-        if f["name"] == settings.JIRA_SEVERITY_FIELD_NAME
-    ]
-    if severity_fields:
-        severity_field_id = severity_fields[0]["id"]
-    return severity_field_id
+    return metadata.get_field_id(settings.JIRA_SEVERITY_FIELD_NAME)
 
 
 def get_incident_manager(fullname):
     """
-    Return an incident manager by his/her full name.
+    Return an incident manager by his/her full name. The person is
+    looked up in the person directory (see `jpi.persons`).
     """
-    persons = jira.search_issues(
-        f'project={settings.PERSON_PROJECT_KEY} and summary~"{fullname}"'
-    )
-    if persons['issues']:
-        return persons['issues'][0]
+    return persons.find_person(fullname)
 
 
-def create_jira_incident(summary, description=None, incident_manager=None):
+def get_question_fields():
     """
-    Create Jira issue in project with key `INCIDENT`.
+    Return the fields of the predefined questions (see `QUESTIONS_FILE`).
+    """
+    return [
+        {
+            "project": {"key": settings.QUESTION_PROJECT_KEY},
+            "summary": q["summary"],
+            "description": q["description"],
+            "issuetype": {"name": settings.QUESTION_PROJECT_KEY.title()},
+        }
+        for q in get_questions()
+    ]
+
+
+def get_incident_fields(summary, description=None):
+    """
+    Return the fields of a Jira issue in project with key `INCIDENT`.
     """
     fields = {
         "project": {"key": settings.INCIDENT_PROJECT_KEY},
@@ -104,39 +162,167 @@ def create_jira_incident(summary, description=None, incident_manager=None):
         fields[severity_field_id] = {
             "value": settings.JIRA_INCIDENT_SEVERITY
         }
-    issue = jira.create_issue(fields)
-    for q in get_questions():
-        fields = {
-            "project": {"key": settings.QUESTION_PROJECT_KEY},
-            "summary": q["summary"],
-            "description": q["description"],
-            "issuetype": {"name": settings.QUESTION_PROJECT_KEY.title()},
-        }
-        question = jira.create_issue(fields)
-        link_issue(
-            question['key'], issue['key'], settings.QUESTION_ISSUE_TYPE_NAME)
+    return fields
+
+
+def get_stakeholders():
     stakeholders = settings.JIRA_ISSUE_STAKEHOLDERS
-    stakeholders = [q for q in stakeholders.split(",") if q]
-    for s in stakeholders:
-        link_issue(s, issue['key'], settings.STAKEHOLDER_ISSUE_TYPE_NAME)
+    return [s for s in stakeholders.split(",") if s]
+
+
+def create_questions():
+    """
+    Create the predefined questions (see `QUESTIONS_FILE`) by means of
+    the bulk endpoint. Return the list of the created questions.
+    """
+    fields_list = get_question_fields()
+    if not fields_list or not check_issue_type(fields_list[0]["issuetype"]):
+        return []
+    return [q for q in jira.create_issues(fields_list) if q]
+
+
+def create_link(outward, inward, link_type):
+    """
+    A version of `link_issue` that raises an exception if the link
+    isn't created.
+    """
+    if not metadata.has_link_type(link_type):
+        raise Exception(f'Issue link type "{link_type}" does not exist')
+    try:
+        jira.create_issue_link(link_type, inward, outward)
+    except HTTPError as error:
+        handle_link_error(error)
+        raise
+    logger.info(f'Issue link type "{link_type}" successfully created')
+
+
+def create_jira_incident(summary, description=None, incident_manager=None):
+    """
+    Create Jira issue in project with key `INCIDENT`. Once the issue is
+    created, its questions and links are created concurrently (see
+    `wire_jira_incident`).
+    """
+    try:
+        issue = jira.create_issue(get_incident_fields(summary, description))
+    except Exception as error:
+        handle_incident_error(error)
+        raise
+    wire_jira_incident(issue['key'], incident_manager)
+    return issue
+
+
+def wire_jira_incident(issue_key, incident_manager=None):
+    """
+    Create the questions of the incident issue `issue_key` and link the
+    questions, the stakeholders and the incident manager to it. The
+    calls are fanned out (see `jpi.fanout`), the questions are linked
+    once they are created. Return a `FanOutResult` of `questions` (the
+    created questions) and of the links, e.g. `question:QUESTION-1`,
+    `stakeholder:PERSON-1` or `incident-manager:PERSON-2`. The failures
+    are logged.
+    """
+    tasks = [("questions", create_questions, ())]
+    tasks.extend(
+        (
+            f"stakeholder:{s}",
+            create_link,
+            (s, issue_key, settings.STAKEHOLDER_ISSUE_TYPE_NAME),
+        )
+        for s in get_stakeholders()
+    )
     if incident_manager:
-        link_issue(
-            incident_manager['key'],
-            issue['key'],
-            settings.INCIDENT_MANAGER_ISSUE_TYPE_NAME
+        tasks.append((
+            f"incident-manager:{incident_manager['key']}",
+            create_link,
+            (
+                incident_manager['key'],
+                issue_key,
+                settings.INCIDENT_MANAGER_ISSUE_TYPE_NAME,
+            ),
+        ))
+    result = fanout.fan_out(tasks)
+    result.update(fanout.fan_out([
+        (
+            f"question:{q['key']}",
+            create_link,
+            (q['key'], issue_key, settings.QUESTION_ISSUE_TYPE_NAME),
         )
-    return issue
+        for q in result.results.get("questions", [])
+    ]))
+    for name, error in result.errors.items():
+        logger.error(
+            f'Error occurred while wiring "{issue_key}" issue ({name}): '
+            f'{error!r}'
+        )
+    return result
+
+
+def handle_incident_error(error):
+    """
+    Invalidate the cached fields if Jira rejects the severity field of
+    an incident, e.g. the field has been recreated with another `id`.
+    """
+    severity_field_id = get_jira_severity_field_id()
+    if severity_field_id and severity_field_id in str(error):
+        metadata.invalidate(metadata.FIELDS)
+
+
+async def create_jira_incident_async(
+    summary, description=None, incident_manager=None
+):
+    """
+    An asynchronous version of `create_jira_incident`: the issue is
+    created and wired by the same calls, which are run in the executor
+    of the Jira requests (see `jpi.api.jira_async`).
+    """
+    return await jira_async.run(
+        create_jira_incident, summary, description, incident_manager
+    )
+
+
+def mark_issue_as_done(issue_key):
+    """
+    Transition the issue to "Done" by means of the cached transition
+    of its workflow (see `jpi.metadata`).
+    """
+    transition_id = metadata.get_done_transition_id(issue_key)
+    if transition_id is None:
+        raise Exception(f'Issue "{issue_key}" has no "Done" transition')
+    try:
+        jira.transition_issue(issue_key, transition_id)
+    except HTTPError:
+        raise
+    except Exception:
+        # Jira responds with 400 if the transition isn't available,
+        # e.g. the workflow has been changed.
+        metadata.invalidate(metadata.DONE_TRANSITIONS)
+        transition_id = metadata.get_done_transition_id(issue_key)
+        if transition_id is None:
+            raise
+        jira.transition_issue(issue_key, transition_id)
 
 
 def resolve_incident(incident_id):
     db.put_incident(incident_id, {settings.RESOLVED_FIELD_NAME: db.get_now()})
 
 
-def last_polling_timestamp():
-    return db.get_config_parameter(settings.LAST_POLLING_TIMESTAMP_PARAM)
+def last_polling_timestamp(param=settings.LAST_POLLING_TIMESTAMP_PARAM):
+    return db.get_config_parameter(param)
 
 
-def update_polling_timestamp(timestamp):
-    return db.update_config_parameter(
-        settings.LAST_POLLING_TIMESTAMP_PARAM, timestamp
-    )
+def update_polling_timestamp(
+    timestamp, param=settings.LAST_POLLING_TIMESTAMP_PARAM
+):
+    return db.update_config_parameter(param, timestamp)
+
+
+def last_polling_cursor(param=settings.POLLING_CURSOR_PARAM):
+    return db.get_config_parameter(param)
+
+
+def update_polling_cursor(cursor, param=settings.POLLING_CURSOR_PARAM):
+    return db.update_config_parameter(param, cursor)
+
+
+def delete_polling_cursor(param=settings.POLLING_CURSOR_PARAM):
+    return db.delete_config_parameter(param)
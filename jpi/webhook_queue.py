@@ -0,0 +1,184 @@
+import contextlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from jpi import settings
+
+
+SOURCES = ("pagerduty", "jira")
+
+queue = None
+logger = logging.getLogger(__name__)
+
+
+def validate_message(source, payload):
+    """
+    Return an error message if the webhook payload can't be queued.
+    """
+    if source not in SOURCES:
+        return f"Unknown webhook source: {source}"
+    if not isinstance(payload, dict):
+        return "JSON object is expected"
+    if source == "pagerduty" and not isinstance(payload.get("messages"), list):
+        return '"messages" list is expected'
+    if source == "jira" and "webhookEvent" not in payload:
+        return '"webhookEvent" is expected'
+
+
+class SQSQueue:
+    """
+    A queue based on Amazon SQS. The messages are received by the
+    `webhook_queue` function (see `serverless.yml`).
+    """
+
+    def __init__(self, queue_url):
+        import boto3
+
+        self.queue_url = queue_url
+        self.client = boto3.client("sqs")
+
+    def send(self, message):
+        self.client.send_message(
+            QueueUrl=self.queue_url, MessageBody=json.dumps(message)
+        )
+
+
+class SQLiteQueue:
+    """
+    A local stand-in of the SQS queue that keeps the messages in a
+    SQLite database, so the queued webhooks survive a restart of the
+    local server. A received message is hidden for
+    `WEBHOOK_QUEUE_VISIBILITY_TIMEOUT` seconds and is received again if
+    it isn't deleted within the timeout.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.has_messages = threading.Event()
+        self.worker = None
+        with self.connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "body TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, "
+                "visible_at REAL NOT NULL)"
+            )
+
+    @contextlib.contextmanager
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def send(self, message):
+        with self.connect() as conn:
+            conn.execute(
+                "INSERT INTO messages (body, visible_at) VALUES (?, ?)",
+                (json.dumps(message), time.time()),
+            )
+        self.has_messages.set()
+
+    def receive(self, max_messages=10):
+        """
+        Return a list of `(id, message, attempts)` tuples.
+        """
+        now = time.time()
+        visible_at = now + settings.WEBHOOK_QUEUE_VISIBILITY_TIMEOUT
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT id, body, attempts FROM messages "
+                "WHERE visible_at <= ? ORDER BY id LIMIT ?",
+                (now, max_messages),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE messages SET attempts = attempts + 1, visible_at = ? "
+                "WHERE id = ?",
+                [(visible_at, row[0]) for row in rows],
+            )
+            conn.execute("COMMIT")
+        return [
+            (message_id, json.loads(body), attempts + 1)
+            for message_id, body, attempts in rows
+        ]
+
+    def delete(self, message_id):
+        with self.connect() as conn:
+            conn.execute("DELETE FROM messages WHERE id = ?", (message_id,))
+
+    def retry_later(self, message_id, delay):
+        with self.connect() as conn:
+            conn.execute(
+                "UPDATE messages SET visible_at = ? WHERE id = ?",
+                (time.time() + delay, message_id),
+            )
+
+    def drain(self, process):
+        """
+        Process the available messages by means of `process` function.
+        A failed message is retried with a backoff up to
+        `WEBHOOK_QUEUE_MAX_ATTEMPTS` times. Return the number of the
+        received messages.
+        """
+        messages = self.receive()
+        for message_id, message, attempts in messages:
+            try:
+                process(message)
+            except Exception:
+                logger.exception(
+                    f"Error occurred while processing a queued webhook "
+                    f"(attempt {attempts})"
+                )
+                if attempts < settings.WEBHOOK_QUEUE_MAX_ATTEMPTS:
+                    self.retry_later(message_id, 2 ** attempts)
+                    continue
+                logger.error(f"Dropping the queued webhook: {message}")
+            self.delete(message_id)
+        return len(messages)
+
+    def start_worker(self, process):
+        """
+        Start a background thread that drains the queue.
+        """
+        if self.worker is not None:
+            return
+
+        def run():
+            while True:
+                try:
+                    if self.drain(process):
+                        continue
+                except Exception:
+                    logger.exception("Error occurred while draining queue")
+                self.has_messages.wait(settings.WEBHOOK_QUEUE_POLL_INTERVAL)
+                self.has_messages.clear()
+
+        self.worker = threading.Thread(
+            target=run, name="webhook-queue", daemon=True
+        )
+        self.worker.start()
+
+
+def get_queue():
+    global queue
+    if queue is None:
+        if settings.WEBHOOK_QUEUE_BACKEND == "sqs":
+            queue = SQSQueue(settings.WEBHOOK_QUEUE_URL)
+        elif settings.WEBHOOK_QUEUE_BACKEND == "sqlite":
+            queue = SQLiteQueue(settings.WEBHOOK_QUEUE_SQLITE_PATH)
+        else:
+            raise Exception(
+                f"Unknown webhook queue backend: "
+                f"{settings.WEBHOOK_QUEUE_BACKEND}"
+            )
+    return queue
@@ -1,6 +1,7 @@
+import functools
 import logging
 
-from jpi import db, settings, utils
+from jpi import db, dedup, resolver, settings
 
 
 logger = logging.getLogger(__name__)
@@ -9,7 +10,8 @@ logger = logging.getLogger(__name__)
 def webhook_handler(event):
     """
     A webhook handler that should handle the events triggered by
-    Jira webhook.
+    Jira webhook. If the event fails, it is released (see
+    `jpi.dedup`), so the next delivery is handled again.
     """
     changelog = event.get("changelog", {})
     changes = changelog.get("items", [{}])
@@ -23,22 +25,48 @@ def webhook_handler(event):
     if has_done:
         issue_key = event.get("issue", {}).get("key")
     if issue_key is not None:
-        incident_id = db.get_incident_id_by_issue_key(issue_key)
-        if incident_id:
-            pagerduty = utils.get_pagerduty()
-            try:
-                pagerduty.rput(
-                    settings.INCIDENT_ENDPOINT,
-                    json=[{
-                        "id": incident_id,
-                        "type": "incident_reference",
-                        "status": settings.STATUS_RESOLVED,
-                    }],
+        event_id = get_event_id(event, issue_key)
+        if not dedup.claim_event(event_id):
+            return
+        try:
+            incident_id = db.get_incident_id_by_issue_key(issue_key)
+            incident = None
+            if incident_id:
+                incident = db.get_incident_by_id(incident_id)
+            if incident:
+                # The incidents are resolved in bulk (see `jpi.resolver`)
+                # in the account of the shard that created them.
+                resolver.get_resolver().resolve(
+                    incident_id,
+                    functools.partial(
+                        handle_resolution, incident_id, event_id
+                    ),
+                    incident.get(settings.SHARD_FIELD_NAME),
                 )
-                utils.resolve_incident(incident_id)
-            except Exception:
-                msg = (
-                    f"[{incident_id}] Exception occurred during updating of "
-                    f"a PagerDuty incident"
-                )
-                logger.exception(msg)
+        except Exception:
+            dedup.release_event(event_id)
+            raise
+
+
+def handle_resolution(incident_id, event_id, future):
+    error = future.exception()
+    if error is not None:
+        msg = (
+            f"[{incident_id}] Exception occurred during updating of "
+            f"a PagerDuty incident"
+        )
+        logger.error(msg, exc_info=error)
+        dedup.release_event(event_id)
+
+
+def get_event_id(event, issue_key):
+    """
+    Return an id of the event, the same for the redeliveries of the
+    event. The id of the changelog is used if it is available.
+    """
+    changelog_id = event.get("changelog", {}).get("id")
+    if changelog_id:
+        return f"jira:changelog:{changelog_id}"
+    return "jira:{}:{}:{}".format(
+        event.get("webhookEvent"), event.get("timestamp"), issue_key
+    )
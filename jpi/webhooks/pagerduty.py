@@ -1,7 +1,7 @@
 import logging
 from requests.exceptions import HTTPError
 
-from jpi import db, settings, utils
+from jpi import db, dedup, fanout, settings, utils
 from jpi.api import jira
 
 
@@ -28,17 +28,28 @@ def handle_triggered_incident(message):
         db_issue_key = db.get_issue_key_by_incident_id(incident_id)
         if not db_issue_key:
             entries = message.get("log_entries", [])
-            for entry in entries:
+            incident_manager = None
+            if entries:
                 incident_manager = utils.get_incident_manager(
                     entries[0]["agent"]["summary"]
                 )
-                issue = utils.create_jira_incident(
-                    entry["channel"]["summary"],
-                    entry["channel"]["details"],
-                    incident_manager=incident_manager,
+            result = fanout.fan_out([
+                (
+                    i,
+                    utils.create_jira_incident,
+                    (
+                        entry["channel"]["summary"],
+                        entry["channel"]["details"],
+                        incident_manager,
+                    ),
                 )
+                for i, entry in enumerate(entries)
+            ])
+            for issue in result.results.values():
                 incident_fields[settings.ISSUE_KEY_FIELD_NAME] = issue['key']
                 db.put_incident(incident_id, incident_fields)
+            if result.errors:
+                raise next(iter(result.errors.values()))
     else:
         db.put_incident(incident_id, incident_fields)
 
@@ -53,7 +64,7 @@ def handle_resolved_incident(message):
         except HTTPError:
             logger.exception("Error occurred when getting Jira issue")
         try:
-            jira.mark_issue_as_done(issue_key)
+            utils.mark_issue_as_done(issue_key)
             utils.resolve_incident(incident_id)
         except HTTPError:
             logger.exception("Error occurred while resolving Jira issue")
@@ -67,6 +78,29 @@ def webhook_handler(event):
     messages = event.get("messages", [])
     for message in messages:
         if message.get("event") == "incident.trigger":
-            handle_triggered_incident(message)
+            handle_message(message, handle_triggered_incident)
         elif message.get("event") == "incident.resolve":
-            handle_resolved_incident(message)
+            handle_message(message, handle_resolved_incident)
+
+
+def handle_message(message, handle):
+    """
+    Handle the message unless it was already handled, i.e. PagerDuty
+    redelivered it. The message is released if handling fails, so the
+    next delivery is handled again.
+    """
+    event_id = get_event_id(message)
+    if event_id and not dedup.claim_event(event_id):
+        return
+    try:
+        handle(message)
+    except Exception:
+        if event_id:
+            dedup.release_event(event_id)
+        raise
+
+
+def get_event_id(message):
+    message_id = message.get("id")
+    if message_id:
+        return f"pagerduty:{message_id}"
@@ -0,0 +1,143 @@
+from datetime import datetime, timedelta
+import unittest
+from unittest import mock
+
+import pytz
+
+from jpi import db, settings
+
+
+NOW = datetime(2020, 1, 3, 12, 30, tzinfo=pytz.utc)
+
+
+def get_log_entry(log_entry_id, age):
+    created_at = NOW - age
+    return {"id": log_entry_id, "created_at": created_at.isoformat()}
+
+
+class LogEntriesHorizonTestCase(unittest.TestCase):
+    def test_expired_bucket_is_before_horizon(self):
+        horizon = db.get_log_entries_horizon(NOW)
+        retention = timedelta(hours=settings.LOG_ENTRIES_DEDUP_RETENTION_HOURS)
+        for age in (retention, retention + timedelta(minutes=20)):
+            bucket = db.get_log_entry_bucket(get_log_entry("LE", age))
+            self.assertGreater(db.get_bucket_expiration(bucket), NOW)
+            self.assertGreater(bucket, horizon)
+        for age in (retention + timedelta(minutes=40), retention * 2):
+            bucket = db.get_log_entry_bucket(get_log_entry("LE", age))
+            self.assertLessEqual(db.get_bucket_expiration(bucket), NOW)
+            self.assertLessEqual(bucket, horizon)
+
+
+class LogEntriesStateTestCase(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(db, "batch_get_items")
+        self.batch_get_items = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(
+            db,
+            "get_log_entries_horizon",
+            return_value=db.get_log_entries_horizon(NOW),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_requested_keys(self, call):
+        keys = call[0][0][settings.LOG_ENTRIES_TABLE]
+        return [key[settings.LOG_ENTRY_ID_FIELD_NAME] for key in keys]
+
+    def test_live_buckets_are_read(self):
+        retention = timedelta(hours=settings.LOG_ENTRIES_DEDUP_RETENTION_HOURS)
+        log_entries = [
+            get_log_entry("NEW", timedelta(minutes=5)),
+            get_log_entry("OLD", retention + timedelta(minutes=20)),
+            get_log_entry("EXPIRED", retention + timedelta(minutes=40)),
+        ]
+        self.batch_get_items.return_value = {
+            settings.LOG_ENTRIES_TABLE: [],
+            settings.INCIDENTS_TABLE: [],
+        }
+        with mock.patch.object(
+            settings, "LOG_ENTRIES_READ_LEGACY_ITEMS", False
+        ):
+            processed_ids, _ = db.get_log_entries_state(
+                "eu", log_entries, []
+            )
+        self.assertEqual(processed_ids, {"EXPIRED"})
+        self.assertEqual(
+            self.get_requested_keys(self.batch_get_items.call_args_list[0]),
+            [
+                "bucket#eu#2020-01-01T12#{}".format(
+                    db.get_bucket_partition("OLD")
+                ),
+                "bucket#eu#2020-01-03T12#{}".format(
+                    db.get_bucket_partition("NEW")
+                ),
+            ],
+        )
+
+    def test_legacy_items_are_read(self):
+        log_entries = [
+            get_log_entry("BUCKET", timedelta(minutes=5)),
+            get_log_entry("LEGACY", timedelta(minutes=5)),
+            get_log_entry("NEW", timedelta(minutes=5)),
+        ]
+        self.batch_get_items.side_effect = [
+            {
+                settings.LOG_ENTRIES_TABLE: [{
+                    settings.LOG_ENTRY_ID_FIELD_NAME: "bucket#eu#...",
+                    settings.LOG_ENTRY_IDS_FIELD_NAME: {"BUCKET"},
+                }],
+                settings.INCIDENTS_TABLE: [],
+            },
+            {
+                settings.LOG_ENTRIES_TABLE: [
+                    {settings.LOG_ENTRY_ID_FIELD_NAME: "LEGACY"},
+                ],
+            },
+        ]
+        with mock.patch.object(
+            settings, "LOG_ENTRIES_READ_LEGACY_ITEMS", True
+        ):
+            processed_ids, _ = db.get_log_entries_state(
+                "eu", log_entries, []
+            )
+        self.assertEqual(processed_ids, {"BUCKET", "LEGACY"})
+        self.assertEqual(
+            self.get_requested_keys(self.batch_get_items.call_args_list[1]),
+            ["LEGACY", "NEW"],
+        )
+
+
+class PutLogEntriesTestCase(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(db, "get_resource")
+        table = patcher.start().return_value.Table.return_value
+        self.update_item = table.update_item
+        self.addCleanup(patcher.stop)
+
+    def test_ids_are_spread_over_bucket_items(self):
+        log_entries = [
+            get_log_entry(f"LE{i}", timedelta(minutes=5)) for i in range(20)
+        ]
+        with mock.patch.object(settings, "LOG_ENTRIES_BUCKET_PARTITIONS", 4):
+            db.put_log_entries("eu", log_entries)
+        ids = {}
+        for call in self.update_item.call_args_list:
+            key = call[1]["Key"][settings.LOG_ENTRY_ID_FIELD_NAME]
+            ids[key] = call[1]["ExpressionAttributeValues"][":ids"]
+        self.assertEqual(
+            sorted(ids),
+            [f"bucket#eu#2020-01-03T12#{n}" for n in range(4)],
+        )
+        self.assertEqual(
+            set.union(*ids.values()), {e["id"] for e in log_entries}
+        )
+        for key, log_entry_ids in ids.items():
+            for log_entry_id in log_entry_ids:
+                partition = db.get_bucket_partition(log_entry_id)
+                self.assertTrue(key.endswith(f"#{partition}"))
+
+
+if __name__ == "__main__":
+    unittest.main()
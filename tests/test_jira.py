@@ -0,0 +1,91 @@
+import json
+import unittest
+from unittest import mock
+
+import requests
+
+from jpi import settings
+from jpi.api import jira
+
+
+def get_response(status_code, body):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(body).encode()
+    return response
+
+
+def get_fields(summary):
+    return {"project": {"key": "QUESTION"}, "summary": summary}
+
+
+class CreateIssuesTestCase(unittest.TestCase):
+    def setUp(self):
+        client = jira.JiraClient(
+            "http://jira.local", "user", "token", rate=1000, burst=1000
+        )
+        patcher = mock.patch.object(jira, "client", client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(client.session, "request")
+        self.request = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_sent_summaries(self):
+        return [
+            [u["fields"]["summary"] for u in c[1]["json"]["issueUpdates"]]
+            for c in self.request.call_args_list
+        ]
+
+    def test_failed_issues_are_mapped_back(self):
+        self.request.return_value = get_response(201, {
+            "issues": [{"key": "Q-1"}, {"key": "Q-2"}],
+            "errors": [{"failedElementNumber": 1, "status": 400}],
+        })
+        issues = jira.create_issues(
+            [get_fields("first"), get_fields("second"), get_fields("third")]
+        )
+        self.assertEqual(issues, [{"key": "Q-1"}, None, {"key": "Q-2"}])
+
+    def test_all_issues_failed(self):
+        self.request.return_value = get_response(400, {
+            "issues": [],
+            "errors": [
+                {"failedElementNumber": 0, "status": 400},
+                {"failedElementNumber": 1, "status": 400},
+            ],
+        })
+        issues = jira.create_issues([get_fields("a"), get_fields("b")])
+        self.assertEqual(issues, [None, None])
+
+    def test_issues_are_sent_in_chunks(self):
+        self.request.side_effect = [
+            get_response(201, {
+                "issues": [{"key": "Q-1"}],
+                "errors": [{"failedElementNumber": 1, "status": 400}],
+            }),
+            get_response(201, {"issues": [{"key": "Q-2"}, {"key": "Q-3"}]}),
+            get_response(201, {
+                "issues": [],
+                "errors": [{"failedElementNumber": 0, "status": 400}],
+            }),
+        ]
+        fields_list = [get_fields(str(i)) for i in range(5)]
+        with mock.patch.object(settings, "JIRA_BULK_CHUNK_SIZE", 2):
+            issues = jira.create_issues(fields_list)
+        self.assertEqual(
+            self.get_sent_summaries(), [["0", "1"], ["2", "3"], ["4"]]
+        )
+        self.assertEqual(
+            issues,
+            [{"key": "Q-1"}, None, {"key": "Q-2"}, {"key": "Q-3"}, None],
+        )
+
+    def test_server_error_is_raised(self):
+        self.request.return_value = get_response(500, {})
+        with self.assertRaises(requests.HTTPError):
+            jira.create_issues([get_fields("a")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+import importlib
+import unittest
+from unittest import mock
+
+import pytz
+
+from jpi import settings
+
+# `jpi.handlers` exposes the handlers under the names of the modules.
+log_entries = importlib.import_module("jpi.handlers.log_entries")
+
+NOW = datetime(2020, 1, 3, 12, 30, tzinfo=pytz.utc)
+
+
+def get_log_entry(log_entry_id, age):
+    created_at = NOW - age
+    return {"id": log_entry_id, "created_at": created_at.isoformat()}
+
+
+class CursorWatermarkTestCase(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(settings, "LOG_ENTRIES_RETRY_HOURS", 6)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cursor = {
+            "since": str(NOW - timedelta(hours=1)),
+            "until": str(NOW),
+            "offset": 0,
+        }
+
+    def test_failed_log_entry_holds_polling_back(self):
+        entries = [
+            get_log_entry("FAILED", timedelta(minutes=30)),
+            get_log_entry("PROCESSED", timedelta(minutes=20)),
+        ]
+        log_entries.update_cursor_watermark(
+            self.cursor, entries, {"PROCESSED"}, now=NOW
+        )
+        self.assertEqual(
+            log_entries.get_polling_watermark(self.cursor),
+            str(NOW - timedelta(minutes=30)),
+        )
+
+    def test_failing_log_entry_is_given_up(self):
+        entries = [
+            get_log_entry("FAILING", timedelta(hours=7)),
+            get_log_entry("PROCESSED", timedelta(minutes=5)),
+        ]
+        with self.assertLogs(log_entries.logger, "ERROR"):
+            log_entries.update_cursor_watermark(
+                self.cursor, entries, {"PROCESSED"}, now=NOW
+            )
+        self.assertNotIn("pending", self.cursor)
+        self.assertEqual(
+            log_entries.get_polling_watermark(self.cursor),
+            str(NOW - timedelta(minutes=5)),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+import os
+import unittest
+from unittest import mock
+
+import pytz
+
+from jpi import db, persons, settings
+
+
+NOW = datetime.now(pytz.utc).replace(microsecond=0)
+
+
+def get_issue(key, summary):
+    return {"key": key, "fields": {"summary": summary}}
+
+
+class RefreshDirectoryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.snapshot = {
+            # `str` drops the microseconds when they are 0.
+            "loaded": str(NOW - timedelta(hours=1)),
+            "lastSync": str(NOW - timedelta(minutes=1)),
+            "persons": {
+                "jane doe": {"key": "PERSON-1", "summary": "Jane Doe"},
+            },
+        }
+        patcher = mock.patch.dict(os.environ, {"PERSON_PROJECT_KEY": "PERSON"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # The setting may have been read from the environment already.
+        patcher = mock.patch.object(settings, "PERSON_PROJECT_KEY", "PERSON")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(
+            db, "get_config_parameter", return_value=self.snapshot
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(db, "update_config_parameter")
+        self.update_config_parameter = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(persons.jira, "iter_search_issues")
+        self.iter_search_issues = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_unchanged_directory_is_not_written(self):
+        self.iter_search_issues.return_value = [
+            get_issue("PERSON-1", "Jane Doe")
+        ]
+        directory = persons.refresh_directory()
+        self.update_config_parameter.assert_not_called()
+        self.assertEqual(directory, self.snapshot)
+
+    def test_renamed_person_is_written(self):
+        self.iter_search_issues.return_value = [
+            get_issue("PERSON-1", "Janet Doe")
+        ]
+        directory = persons.refresh_directory()
+        self.update_config_parameter.assert_called_once_with(
+            settings.PERSON_DIRECTORY_PARAM, directory
+        )
+        self.assertEqual(
+            directory["persons"],
+            {"janet doe": {"key": "PERSON-1", "summary": "Janet Doe"}},
+        )
+        self.assertGreater(
+            db.parse_timestamp(directory["lastSync"]),
+            db.parse_timestamp(self.snapshot["lastSync"]),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+import importlib
+import json
+import unittest
+from unittest import mock
+
+from pdpyras import PDClientError
+import requests
+
+from jpi import resolver, settings, utils
+
+# `jpi.handlers` exposes the handlers under the names of the modules.
+webhook_queue = importlib.import_module("jpi.handlers.webhook_queue")
+
+
+def get_incident(incident_id, status=settings.STATUS_RESOLVED):
+    return {"id": incident_id, "status": status}
+
+
+def get_error(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return PDClientError("Error", response=response)
+
+
+class ResolverTestCase(unittest.TestCase):
+    def setUp(self):
+        self.resolver = resolver.Resolver(window=60, batch_size=10)
+        patcher = mock.patch.object(utils, "get_pagerduty")
+        self.rput = patcher.start().return_value.rput
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(utils, "resolve_incident")
+        self.resolve_incident = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def submit(self, *incident_ids):
+        with self.resolver.batched() as futures:
+            for incident_id in incident_ids:
+                self.resolver.submit(incident_id)
+        return futures
+
+    def get_sent_ids(self):
+        return [
+            [reference["id"] for reference in c[1]["json"]]
+            for c in self.rput.call_args_list
+        ]
+
+    def test_incidents_are_coalesced(self):
+        self.rput.return_value = [get_incident("P1"), get_incident("P2")]
+        futures = self.submit("P1", "P2", "P1")
+        self.assertEqual(self.get_sent_ids(), [["P1", "P2"]])
+        self.assertEqual(
+            [future.result()["id"] for future in futures], ["P1", "P2", "P1"]
+        )
+        self.assertEqual(self.resolve_incident.call_count, 2)
+
+    def test_unresolved_incident_fails(self):
+        self.rput.return_value = [
+            get_incident("P1"),
+            get_incident("P2", status="acknowledged"),
+        ]
+        futures = self.submit("P1", "P2")
+        self.assertIsNone(futures[0].exception())
+        self.assertIsNotNone(futures[1].exception())
+        self.resolve_incident.assert_called_once_with("P1")
+
+    def test_rejected_batch_is_resolved_one_by_one(self):
+        self.rput.side_effect = [
+            get_error(400),
+            [get_incident("P1")],
+            get_error(400),
+        ]
+        futures = self.submit("P1", "P2")
+        self.assertEqual(self.get_sent_ids(), [["P1", "P2"], ["P1"], ["P2"]])
+        self.assertIsNone(futures[0].exception())
+        self.assertIsNotNone(futures[1].exception())
+
+    def test_incidents_are_resolved_in_accounts_of_shards(self):
+        sessions = {"eu": mock.Mock(), "us": mock.Mock()}
+        for name, session in sessions.items():
+            session.rput.return_value = [get_incident(name.upper())]
+        shard_sessions = mock.patch.object(
+            resolver,
+            "get_pagerduty",
+            side_effect=lambda name: sessions.get(name, utils.get_pagerduty()),
+        )
+        self.rput.return_value = [get_incident("DEFAULT")]
+        with shard_sessions, self.resolver.batched() as futures:
+            self.resolver.submit("EU", "eu")
+            self.resolver.submit("DEFAULT")
+            self.resolver.submit("US", "us")
+        self.assertEqual(
+            [future.result()["id"] for future in futures],
+            ["EU", "DEFAULT", "US"],
+        )
+        self.assertEqual(self.get_sent_ids(), [["DEFAULT"]])
+        for name, session in sessions.items():
+            self.assertEqual(
+                session.rput.call_args[1]["json"][0]["id"], name.upper()
+            )
+
+    def test_failed_batch_is_not_split(self):
+        self.rput.side_effect = get_error(500)
+        futures = self.submit("P1", "P2")
+        self.assertEqual(self.get_sent_ids(), [["P1", "P2"]])
+        for future in futures:
+            self.assertIsInstance(future.exception(), PDClientError)
+
+
+class WebhookQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.resolver = resolver.Resolver(window=60, batch_size=10)
+        patcher = mock.patch.object(
+            resolver, "get_resolver", return_value=self.resolver
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.dict(
+            webhook_queue.HANDLERS, {"test": self.handle}
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(utils, "get_pagerduty")
+        self.rput = patcher.start().return_value.rput
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(utils, "resolve_incident")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def handle(self, payload):
+        if payload.get("error"):
+            raise Exception(payload["error"])
+        self.resolver.resolve(payload["incidentId"], lambda future: None)
+
+    def get_record(self, message_id, payload):
+        body = json.dumps({"source": "test", "payload": payload})
+        return {"messageId": message_id, "body": body}
+
+    def test_unresolved_incidents_are_reported(self):
+        self.rput.return_value = [
+            get_incident("P1"),
+            get_incident("P2", status="acknowledged"),
+        ]
+        result = webhook_queue.handler({"Records": [
+            self.get_record("M1", {"incidentId": "P1"}),
+            self.get_record("M2", {"incidentId": "P2"}),
+            self.get_record("M3", {"error": "Throttled"}),
+        ]}, None)
+        self.assertEqual(self.rput.call_count, 1)
+        self.assertEqual(
+            result["batchItemFailures"],
+            [{"itemIdentifier": "M2"}, {"itemIdentifier": "M3"}],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import importlib
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from jpi import settings
+
+# `jpi.handlers` exposes the handlers under the names of the modules.
+shards = importlib.import_module("jpi.handlers.shards")
+
+
+class ShardTestCase(unittest.TestCase):
+    def test_default_shard_keeps_param_names(self):
+        shard = shards.Shard(shards.DEFAULT_SHARD)
+        self.assertEqual(
+            shard.timestamp_param, settings.LAST_POLLING_TIMESTAMP_PARAM
+        )
+        self.assertEqual(shard.cursor_param, settings.POLLING_CURSOR_PARAM)
+
+    def test_param_names(self):
+        shard = shards.Shard("eu")
+        self.assertEqual(
+            shard.timestamp_param,
+            f"{settings.LAST_POLLING_TIMESTAMP_PARAM}#eu",
+        )
+        self.assertEqual(
+            shard.cursor_param, f"{settings.POLLING_CURSOR_PARAM}#eu"
+        )
+
+    def test_services_are_filtered_by_shard(self):
+        shard = shards.Shard("payments", service_ids=["PS1"], team_ids=["T"])
+        self.assertEqual(shard.get_query_params(), {"team_ids[]": ["T"]})
+        log_entries = [
+            {"id": "LE1", "service": {"id": "PS1"}},
+            {"id": "LE2", "service": {"id": "PS2"}},
+            {"id": "LE3"},
+        ]
+        self.assertEqual(
+            [e["id"] for e in shard.filter_log_entries(log_entries)],
+            ["LE1"],
+        )
+
+
+class LoadShardsTestCase(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(
+            os.environ,
+            {"PAGERDUTY_API_TOKEN": "default", "EU_API_TOKEN": "eu"},
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # The setting may have been read from the environment already.
+        patcher = mock.patch.object(settings, "PAGERDUTY_API_TOKEN", "default")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(shards, "shards", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def load(self, definitions):
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as f:
+            json.dump(definitions, f)
+            f.flush()
+            with mock.patch.object(
+                settings, "LOG_ENTRIES_SHARDS_FILE", f.name
+            ):
+                return shards.get_shards()
+
+    def test_single_default_shard(self):
+        with mock.patch.object(settings, "LOG_ENTRIES_SHARDS_FILE", ""):
+            loaded = shards.get_shards()
+        self.assertEqual([s.name for s in loaded], [shards.DEFAULT_SHARD])
+
+    def test_shard_selection(self):
+        self.load([
+            {"name": "payments", "serviceIds": ["PS1"]},
+            {"name": "platform", "serviceIds": ["PS2"]},
+            {"name": "eu", "apiTokenVariable": "EU_API_TOKEN"},
+        ])
+        self.assertEqual(
+            [s.name for s in shards.get_shards()],
+            ["payments", "platform", "eu"],
+        )
+        selected = shards.get_shards(["eu", "payments"])
+        self.assertEqual([s.name for s in selected], ["payments", "eu"])
+        self.assertEqual(selected[1].api_token, "eu")
+        with self.assertRaisesRegex(Exception, "Unknown .* nope"):
+            shards.get_shards(["eu", "nope"])
+
+    def test_overlapping_shards_are_rejected(self):
+        overlapping = [
+            [{"name": "all"}, {"name": "platform", "teamIds": ["PT1"]}],
+            [
+                {"name": "payments", "serviceIds": ["PS1"]},
+                {"name": "platform", "teamIds": ["PT1"]},
+            ],
+            [
+                {"name": "payments", "serviceIds": ["PS1", "PS2"]},
+                {"name": "platform", "serviceIds": ["PS2"]},
+            ],
+            [{"name": "all"}, {"name": "same", "apiTokenVariable": "TOKEN"}],
+        ]
+        with mock.patch.dict(os.environ, {"TOKEN": "default"}):
+            for definitions in overlapping:
+                with self.subTest(definitions=definitions):
+                    with self.assertRaisesRegex(Exception, "overlap"):
+                        self.load(definitions)
+
+    def test_team_shards_sharing_a_service_are_rejected(self):
+        team_services = {("PT1",): ["PS1", "PS2"], ("PT2",): ["PS3"]}
+        definitions = [
+            {"name": "payments", "teamIds": ["PT1"]},
+            {"name": "platform", "teamIds": ["PT2"]},
+        ]
+        with mock.patch.object(
+            shards.Shard,
+            "get_team_service_ids",
+            lambda shard: team_services[tuple(shard.team_ids)],
+        ):
+            self.assertEqual(len(self.load(definitions)), 2)
+            team_services[("PT2",)].append("PS2")
+            with mock.patch.object(shards, "shards", None):
+                with self.assertRaisesRegex(Exception, 'overlap.*"PS2"'):
+                    self.load(definitions)
+
+    def test_shards_of_different_accounts_may_be_whole(self):
+        loaded = self.load([
+            {"name": "all"},
+            {"name": "eu", "apiTokenVariable": "EU_API_TOKEN"},
+        ])
+        self.assertEqual(len(loaded), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import importlib
+import unittest
+from unittest import mock
+
+from jpi import db, dedup, resolver, settings
+
+# `jpi.webhooks` exposes the handlers under the names of the modules.
+jira_webhook = importlib.import_module("jpi.webhooks.jira")
+
+
+def get_done_event(changelog_id):
+    return {
+        "webhookEvent": "jira:issue_updated",
+        "issue": {"key": "INCIDENT-1"},
+        "changelog": {
+            "id": changelog_id,
+            "items": [{"fieldId": "status", "toString": "Done"}],
+        },
+    }
+
+
+class JiraWebhookTestCase(unittest.TestCase):
+    def setUp(self):
+        self.events = set()
+        patcher = mock.patch.object(dedup, "recent_events", dedup.LRUSet(10))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(db, "put_event", self.put_event)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(db, "delete_event", self.events.discard)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(db, "get_incident_id_by_issue_key")
+        self.get_incident_id = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(
+            db, "get_incident_by_id", side_effect=self.get_incident
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(resolver, "get_resolver")
+        self.resolve = patcher.start().return_value.resolve
+        self.addCleanup(patcher.stop)
+
+    def get_incident(self, incident_id):
+        return {
+            settings.INCIDENT_ID_FIELD_NAME: incident_id,
+            settings.SHARD_FIELD_NAME: "eu",
+        }
+
+    def put_event(self, event_id, expires_at):
+        if event_id in self.events:
+            return False
+        self.events.add(event_id)
+        return True
+
+    def test_duplicate_event_is_skipped(self):
+        self.get_incident_id.return_value = "I1"
+        jira_webhook.webhook_handler(get_done_event("100"))
+        jira_webhook.webhook_handler(get_done_event("100"))
+        self.assertEqual(self.resolve.call_count, 1)
+
+    def test_failed_event_is_handled_again(self):
+        self.get_incident_id.side_effect = [Exception("Throttled"), "I1"]
+        with self.assertRaises(Exception):
+            jira_webhook.webhook_handler(get_done_event("100"))
+        self.resolve.assert_not_called()
+        jira_webhook.webhook_handler(get_done_event("100"))
+        self.assertEqual(self.resolve.call_count, 1)
+        self.assertEqual(self.resolve.call_args[0][0], "I1")
+
+    def test_incident_is_resolved_in_account_of_shard(self):
+        self.get_incident_id.return_value = "I1"
+        jira_webhook.webhook_handler(get_done_event("100"))
+        self.assertEqual(self.resolve.call_args[0][2], "eu")
+
+
+if __name__ == "__main__":
+    unittest.main()